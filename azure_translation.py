@@ -5,6 +5,7 @@ from azure.ai.translation.text.models import InputTextItem
 from azure.core.exceptions import HttpResponseError
 from bot_core.logger import logger
 from dotenv import load_dotenv
+from translation_cache import MISS, get_cache
 
 load_dotenv("../.env")
 
@@ -17,6 +18,12 @@ if key and region:
     credential = TranslatorCredential(key, region)
 
 def translate_to_en(text: str) -> str:
+    cache = get_cache()
+    cached = cache.get("translate", "en", text)
+    if cached is not MISS:
+        return cached
+    if cache.cache_only:
+        raise RuntimeError("Text not found in translation cache (cache-only mode)")
     try:
         target_languages = ["en"]
         input_text_elements = [InputTextItem(text=text)]
@@ -28,6 +35,7 @@ def translate_to_en(text: str) -> str:
         if translation:
             for translated_text in translation.translations:
                 logger.info(f"Translated to: '{translated_text.to}' -> '{translated_text.text}'")
+                cache.set("translate", "en", text, translated_text.text)
                 return translated_text.text
         logger.error(f"Text was not translated: {text}")
         raise RuntimeError("Text was not translated")
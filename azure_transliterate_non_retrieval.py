@@ -1,11 +1,11 @@
 import os
-import json
 import glob
 import requests
 from dotenv import load_dotenv
-from typing import Optional
-import time
+from typing import Dict, List, Optional
 from pathlib import Path
+from translation_cache import MISS, get_cache
+from json_stream import JsonArrayWriter, iter_batches, iter_json_array
 
 load_dotenv("../.env")
 
@@ -34,73 +34,148 @@ language_code_map = {
     'en': None
 }
 
+DETECT_MAX_ELEMENTS = 100
+DETECT_MAX_CHARS = 50000
+TRANSLITERATE_MAX_ELEMENTS = 10
+TRANSLITERATE_MAX_CHARS = 5000
+# Conversations held in memory (and sent through transliterate_texts) at a time
+TRANSLITERATE_CONVERSATION_BATCH = 200
+
+def pack_batches(texts: List[str], max_elements: int, max_chars: int) -> List[List[int]]:
+    """Split texts into batches of indices that respect the per-request element and character limits.
+
+    A single text longer than max_chars is sent on its own; the API decides whether to accept it.
+    """
+    batches = []
+    current = []
+    current_chars = 0
+    for idx, text in enumerate(texts):
+        length = len(text)
+        if current and (len(current) >= max_elements or current_chars + length > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(idx)
+        current_chars += length
+    if current:
+        batches.append(current)
+    return batches
+
+def detect_languages_with_azure(texts: List[str]) -> List[Optional[str]]:
+    """Detect the language of every text using as few /detect requests as possible.
+
+    Results are read from and written to the shared translation cache; only cache
+    misses are sent to Azure, and none are in cache-only mode.
+
+    Returns a list aligned with texts; entries are None where detection failed.
+    """
+    detected: List[Optional[str]] = [None] * len(texts)
+    if not texts:
+        return detected
+    cache = get_cache()
+    misses = []
+    for i, cached in enumerate(cache.get_many('detect', '', texts)):
+        if cached is MISS:
+            misses.append(i)
+        else:
+            detected[i] = cached
+    if not misses or not endpoint or cache.cache_only:
+        return detected
+    url = endpoint + '/detect' + '?api-version=3.0'
+    miss_texts = [texts[i] for i in misses]
+    for batch in pack_batches(miss_texts, DETECT_MAX_ELEMENTS, DETECT_MAX_CHARS):
+        try:
+            body = [{'Text': miss_texts[j]} for j in batch]
+            response = requests.post(url, headers=headers, json=body)
+            if response.status_code == 200:
+                result = response.json()
+                fresh = []
+                for j, item in zip(batch, result):
+                    detected[misses[j]] = item.get('language')
+                    if item.get('language'):
+                        fresh.append((miss_texts[j], item['language']))
+                cache.set_many('detect', '', fresh)
+            else:
+                print(f"Language detection API Error: {response.status_code}")
+        except Exception as e:
+            print(f"Language detection error: {str(e)}")
+    return detected
+
 def detect_language_with_azure(text: str) -> Optional[str]:
-    try:
-        if not endpoint:
-            return None
-        path = '/detect'
-        params = '?api-version=3.0'
-        url = endpoint + path + params
-        
-        body = [{'Text': text}]
-        
-        response = requests.post(url, headers=headers, json=body)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result and len(result) > 0:
-                detected_lang = result[0]['language']
-                confidence = result[0]['score']
-                print(f"    Detected language: {detected_lang} (confidence: {confidence:.2f})")
-                return detected_lang
+    detected_lang = detect_languages_with_azure([text])[0]
+    if detected_lang:
+        print(f"    Detected language: {detected_lang}")
+    return detected_lang
+
+def transliterate_texts(texts: List[str]) -> List[Optional[str]]:
+    """Detect and transliterate a list of texts with batched Azure requests.
+
+    Texts are detected in batches, grouped by their detected language/script and
+    transliterated in batches per group, then scattered back to their original positions.
+
+    Each entry of the returned list follows transliterate_text semantics:
+    the text itself for empty input or on API errors, None for English/unsupported
+    languages, otherwise the transliterated text.
+
+    Final results are cached per text, so previously seen texts cost no API calls.
+    """
+    results: List[Optional[str]] = list(texts)
+    candidates = [i for i, text in enumerate(texts) if text and text.strip()]
+    if not candidates:
+        return results
+
+    cache = get_cache()
+    pending = []
+    for i, cached in zip(candidates, cache.get_many('transliterate', 'Latn', [texts[i] for i in candidates])):
+        if cached is MISS:
+            pending.append(i)
         else:
-            print(f"Language detection API Error: {response.status_code}")
-            return None
-            
-    except Exception as e:
-        print(f"Language detection error: {str(e)}")
-        return None
+            results[i] = cached
+    if not pending:
+        return results
 
-def transliterate_text(text: str) -> Optional[str]:
-    if not text or not text.strip():
-        return text
-    
-    try:
-        detected_language = detect_language_with_azure(text)
-        if not detected_language or detected_language == 'en':
-            return None
-        if detected_language not in language_code_map:
-            return None
-        lang_config = language_code_map[detected_language]
+    detected = detect_languages_with_azure([texts[i] for i in pending])
+
+    groups: Dict[tuple, List[int]] = {}
+    unsupported = []
+    for i, detected_language in zip(pending, detected):
+        lang_config = language_code_map.get(detected_language) if detected_language else None
         if lang_config is None:
-            return None
-        language, from_script, to_script = lang_config
-        
-        if not endpoint:
-            return text
-        
-        path = '/transliterate'
+            results[i] = None
+            if detected_language:
+                unsupported.append((texts[i], None))
+            continue
+        groups.setdefault(lang_config, []).append(i)
+    cache.set_many('transliterate', 'Latn', unsupported)
+
+    if not endpoint or cache.cache_only:
+        return results
+
+    for (language, from_script, to_script), indices in groups.items():
         params = f'?api-version=3.0&language={language}&fromScript={from_script}&toScript={to_script}'
-        url = endpoint + path + params
-        
-        body = [{'Text': text}]
-        
-        response = requests.post(url, headers=headers, json=body)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result and len(result) > 0:
-                return result[0]['text']
-            else:
-                print(f"    Empty response for text: {text[:50]}...")
-                return text
-        else:
-            print(f"    Transliteration API Error: {response.status_code}, {response.text}")
-            return text
-            
-    except Exception as e:
-        print(f"    Transliteration error for text '{text[:50]}...': {str(e)}")
-        return text
+        url = endpoint + '/transliterate' + params
+        group_texts = [texts[i] for i in indices]
+        for batch in pack_batches(group_texts, TRANSLITERATE_MAX_ELEMENTS, TRANSLITERATE_MAX_CHARS):
+            try:
+                body = [{'Text': group_texts[j]} for j in batch]
+                response = requests.post(url, headers=headers, json=body)
+                if response.status_code == 200:
+                    result = response.json()
+                    fresh = []
+                    for j, item in zip(batch, result):
+                        results[indices[j]] = item.get('text', group_texts[j])
+                        if 'text' in item:
+                            fresh.append((group_texts[j], item['text']))
+                    cache.set_many('transliterate', 'Latn', fresh)
+                else:
+                    print(f"    Transliteration API Error: {response.status_code}, {response.text}")
+            except Exception as e:
+                print(f"    Transliteration error for batch of {len(batch)} {language} texts: {str(e)}")
+
+    return results
+
+def transliterate_text(text: str) -> Optional[str]:
+    return transliterate_texts([text])[0]
 
 def process_json_files_in_folder(folder_path: str = "non_retrieval"):
     if not os.path.exists(folder_path):
@@ -123,40 +198,35 @@ def process_json_files_in_folder(folder_path: str = "non_retrieval"):
             continue
         print(f"\nProcessing file {file_index}/{total_files}: {os.path.basename(file_path)}")
         
+        output_filename = f"transliterated_{os.path.basename(file_path)}"
+        path = Path("transliterated_non_retrieval")
+        output_path = os.path.join(path, output_filename)
+        
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            
             file_transliterations = 0
             
-            if isinstance(data, list):
-                for obj_index, obj in enumerate(data):
-                    if "messages" in obj:
-                        print(f"  Processing conversation {obj_index + 1}...")
-                        for message_index, message in enumerate(obj["messages"]):
-                            if message.get("role") == "user":
-                                total_messages_processed += 1
-                                content = message.get("content", "")
-                                if content and content.strip():
-                                    print(f"    Processing user message {message_index + 1}...")
-                                    transliterated = transliterate_text(content)
-                                    if transliterated and transliterated != content:
-                                        message["content_transliterated"] = transliterated
-                                        file_transliterations += 1
-                                        total_transliterations += 1
-                                        print(f"      Original: {content[:100]}...")
-                                        print(f"      Transliterated: {transliterated[:100]}...")
-                                    elif transliterated is None:
-                                        print(f"      Skipped (English or unsupported language)")
-                                    time.sleep(0.2)
-            
-            output_filename = f"transliterated_{os.path.basename(file_path)}"
-            path = Path("transliterated_non_retrieval")
-            path.mkdir(parents=True, exist_ok=True)
-            output_path = os.path.join(path, output_filename)
-            
-            with open(output_path, 'w', encoding='utf-8') as output_file:
-                json.dump(data, output_file, indent=2, ensure_ascii=False)
+            with JsonArrayWriter(output_path) as writer:
+                for batch in iter_batches(iter_json_array(file_path), TRANSLITERATE_CONVERSATION_BATCH):
+                    pending_messages = []
+                    for obj in batch:
+                        if "messages" in obj:
+                            for message in obj["messages"]:
+                                if message.get("role") == "user":
+                                    total_messages_processed += 1
+                                    content = message.get("content", "")
+                                    if content and content.strip():
+                                        pending_messages.append(message)
+
+                    print(f"  Transliterating {len(pending_messages)} user messages from {len(batch)} conversations...")
+                    contents = [message["content"] for message in pending_messages]
+                    for message, content, transliterated in zip(pending_messages, contents, transliterate_texts(contents)):
+                        if transliterated and transliterated != content:
+                            message["content_transliterated"] = transliterated
+                            file_transliterations += 1
+                            total_transliterations += 1
+                    
+                    for obj in batch:
+                        writer.write(obj)
             
             print(f"  Saved {file_transliterations} transliterations to: {output_filename}")
             
@@ -168,16 +238,19 @@ def process_json_files_in_folder(folder_path: str = "non_retrieval"):
     print(f"Total files processed: {total_files}")
     print(f"Total user messages processed: {total_messages_processed}")
     print(f"Total transliterations completed: {total_transliterations}")
+    get_cache().print_stats()
 
 def main():
-    if not subscription_key or not endpoint or not region:
+    if get_cache().cache_only:
+        print("Running in cache-only mode: no Azure requests will be made.")
+    elif not subscription_key or not endpoint or not region:
         print("Error: Azure translation credentials not found in environment variables.")
         print("Please check AZURE_TRANSLATION_KEY, AZURE_TRANSLATION_ENDPOINT, and AZURE_TRANSLATION_REGION")
         return
     
     print("Starting Azure transliteration for non-retrieval files...")
     print("This will:")
-    print("1. Detect language using Azure for each user message")
+    print("1. Detect language using Azure for user messages in batches")
     print("2. Transliterate only if detected language is an Indian language")
     print("3. Skip transliteration for English or unsupported languages")
     print("4. Output saved alongside input as transliterated_*.json")
@@ -0,0 +1,291 @@
+"""
+Composable conversation predicates, evaluated while streaming.
+
+    predicate = ~FarmerIn(EXCLUDED_FARMERS) & RolesInclude("farmuser") & EmptyRetrieval()
+    results = filter_files(paths, predicate, output_for=lambda p: out_dir / p.name, workers=4)
+
+Predicates combine with &, | and ~. Fields the exported files may lack (roles, language, ...)
+are read from the conversation first and from its Mongo document otherwise. Evaluation is pushed
+down in two phases per batch of conversations: predicates that only look at the conversation
+run first, and documents are resolved in bulk (ConversationResolver.resolve_many) only for the
+conversations that survived and are missing a field the remaining predicates need.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence
+
+from conversation_resolver import ConversationResolver, canonical_timestamp, first_user_message, get_resolver
+from daily_conversation_analysis.checkpoint import atomic_write_json
+from daily_conversation_analysis.concurrency import run_concurrently
+from json_stream import JsonArrayWriter, iter_batches, iter_json_array
+
+
+def _field(conv: Dict, doc: Optional[Dict], name: str) -> Any:
+    if conv.get(name) is not None:
+        return conv[name]
+    return (doc or {}).get(name)
+
+
+def has_empty_retrieval(message: Dict) -> bool:
+    """A user message that went through retrieval and got no tools and no FAQ hits."""
+    if message.get("role") == "user" and "retrieval" in message:
+        retrieval = message["retrieval"]
+        tools = retrieval.get("tools", [])
+        faq = retrieval.get("faq", [])
+        return len(tools) == 0 and len(faq) == 0
+    return False
+
+
+class Predicate:
+    # Fields that come from the Mongo document when the conversation does not have them
+    doc_fields: FrozenSet[str] = frozenset()
+
+    def matches(self, conv: Dict, doc: Optional[Dict] = None) -> bool:
+        raise NotImplementedError
+
+    def needs_doc(self, conv: Dict) -> bool:
+        return any(conv.get(name) is None for name in self.doc_fields)
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return And([self, other])
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Or([self, other])
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+
+class And(Predicate):
+    def __init__(self, predicates: Sequence[Predicate]):
+        # Flatten nested Ands so the engine sees every conjunct on its own
+        self.predicates = [q for p in predicates for q in (p.predicates if isinstance(p, And) else [p])]
+        self.doc_fields = frozenset().union(*(p.doc_fields for p in self.predicates))
+
+    def matches(self, conv, doc=None):
+        return all(p.matches(conv, doc) for p in self.predicates)
+
+
+class Or(Predicate):
+    def __init__(self, predicates: Sequence[Predicate]):
+        self.predicates = list(predicates)
+        self.doc_fields = frozenset().union(*(p.doc_fields for p in self.predicates))
+
+    def matches(self, conv, doc=None):
+        return any(p.matches(conv, doc) for p in self.predicates)
+
+
+class Not(Predicate):
+    def __init__(self, predicate: Predicate):
+        self.predicate = predicate
+        self.doc_fields = predicate.doc_fields
+
+    def matches(self, conv, doc=None):
+        return not self.predicate.matches(conv, doc)
+
+
+class FarmerIn(Predicate):
+    def __init__(self, farmer_ids: Iterable[str]):
+        self.farmer_ids = frozenset(farmer_ids)
+
+    def matches(self, conv, doc=None):
+        return conv.get("farmer_id", "") in self.farmer_ids
+
+
+class RolesInclude(Predicate):
+    """The conversation's roles contain role; false when the roles are unknown."""
+
+    doc_fields = frozenset(["roles"])
+
+    def __init__(self, role: str):
+        self.role = role
+
+    def matches(self, conv, doc=None):
+        return self.role in (_field(conv, doc, "roles") or [])
+
+
+class LanguageIn(Predicate):
+    doc_fields = frozenset(["language"])
+
+    def __init__(self, languages: Iterable[str]):
+        self.languages = frozenset(languages)
+
+    def matches(self, conv, doc=None):
+        return _field(conv, doc, "language") in self.languages
+
+
+class EmptyRetrieval(Predicate):
+    """At least one user message got no retrieval hits."""
+
+    def matches(self, conv, doc=None):
+        return any(has_empty_retrieval(message) for message in conv.get("messages", []))
+
+
+class QueryCommon(Predicate):
+    """
+    Classification of the user messages by is_query_common.
+
+    Args:
+        value: Classification to look for.
+        all_messages: Require every classified user message to match instead of any.
+    """
+
+    def __init__(self, value: bool = True, all_messages: bool = False):
+        self.value = value
+        self.all_messages = all_messages
+
+    def matches(self, conv, doc=None):
+        labels = [
+            m["is_query_common"] for m in conv.get("messages", [])
+            if m.get("role") == "user" and isinstance(m.get("is_query_common"), bool)
+        ]
+        if not labels:
+            return False
+        check = all if self.all_messages else any
+        return check(label == self.value for label in labels)
+
+
+class Tagged(Predicate):
+    """The conversation carries any of the given tags (`tags` list, or the `tag` of conversations_by_date)."""
+
+    def __init__(self, tags: Iterable[str]):
+        self.tags = frozenset(tags)
+
+    def matches(self, conv, doc=None):
+        tags = set(conv.get("tags") or [])
+        if conv.get("tag"):
+            tags.add(conv["tag"])
+        return bool(tags & self.tags)
+
+
+class DateBetween(Predicate):
+    """First user message dated (UTC, YYYY-MM-DD) within [start, end]; either bound may be None."""
+
+    def __init__(self, start: Optional[str] = None, end: Optional[str] = None):
+        self.start = start
+        self.end = end
+
+    def matches(self, conv, doc=None):
+        message = first_user_message(conv.get("messages", []))
+        ts = canonical_timestamp(message.get("timestamp")) if message else None
+        if ts is None:
+            return False
+        date = ts[:10]
+        return (self.start is None or date >= self.start) and (self.end is None or date <= self.end)
+
+
+class ConversationFilter:
+    """
+    Applies a predicate to batches of conversations with the two-phase pushdown described above.
+
+    Args:
+        predicate: What to keep.
+        resolver: Used for fields only the Mongo document has; defaults to get_resolver().
+        batch_size: Conversations evaluated (and resolved) together.
+    """
+
+    def __init__(self, predicate: Predicate, resolver: Optional[ConversationResolver] = None, batch_size: int = 500):
+        conjuncts = predicate.predicates if isinstance(predicate, And) else [predicate]
+        self.local = [p for p in conjuncts if not p.doc_fields]
+        self.remote = [p for p in conjuncts if p.doc_fields]
+        # Created up front (not lazily from worker threads) and only when some field may need Mongo
+        self.resolver = resolver or (get_resolver() if self.remote else None)
+        self.batch_size = batch_size
+
+    def filter_batch(self, conversations: List[Dict]) -> List[Dict]:
+        survivors = [c for c in conversations if all(p.matches(c) for p in self.local)]
+        if not self.remote or not survivors:
+            return survivors
+        missing = [c for c in survivors if any(p.needs_doc(c) for p in self.remote)]
+        docs = {}
+        if missing:
+            resolved = self.resolver.resolve_many(c.get("messages", []) for c in missing)
+            docs = {id(c): doc for c, doc in zip(missing, resolved)}
+        return [c for c in survivors if all(p.matches(c, docs.get(id(c))) for p in self.remote)]
+
+    def iter_matches(self, conversations: Iterable[Dict]) -> Iterator[Dict]:
+        for batch in iter_batches(conversations, self.batch_size):
+            yield from self.filter_batch(batch)
+
+
+def filter_file(
+    path: Path,
+    conversation_filter: ConversationFilter,
+    output_path: Path,
+) -> Dict[str, Any]:
+    """
+    Stream one file through the filter into output_path. The output is only created when there
+    are matches.
+
+    Returns:
+        {"source", "output" (None without matches), "scanned", "matches", "error" (on failure)}
+    """
+    result = {"source": str(path), "output": None, "scanned": 0, "matches": 0}
+    writer = None
+
+    def counted(conversations):
+        for conv in conversations:
+            result["scanned"] += 1
+            yield conv
+
+    try:
+        for conv in conversation_filter.iter_matches(counted(iter_json_array(path))):
+            if writer is None:
+                writer = JsonArrayWriter(output_path)
+            writer.write(conv)
+        if writer is not None:
+            writer.close()
+            result["output"] = str(output_path)
+            result["matches"] = writer.count
+    except Exception as e:
+        if writer is not None:
+            writer.abort()
+        result["error"] = str(e)
+    return result
+
+
+def filter_files(
+    paths: Sequence[Path],
+    predicate: Predicate,
+    output_for: Callable[[Path], Path],
+    workers: int = 4,
+    manifest_path: Optional[Path] = None,
+    resolver: Optional[ConversationResolver] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Filter several files at the same time, one output per source (see filter_file).
+
+    With manifest_path, the per-source results are also written there as
+    {"sources": {source: {"output", "scanned", "matches", "stamp"}}}; see sources_with_matches.
+    """
+    conversation_filter = ConversationFilter(predicate, resolver)
+    results = run_concurrently(
+        lambda path: filter_file(Path(path), conversation_filter, output_for(Path(path))),
+        list(paths),
+        max_workers=workers,
+        desc="Files",
+        unit="file",
+    )
+    if manifest_path is not None:
+        sources = {}
+        for result in results:
+            if "error" in result:
+                continue
+            stat = os.stat(result["source"])
+            sources[result["source"]] = {
+                "output": result["output"],
+                "scanned": result["scanned"],
+                "matches": result["matches"],
+                "stamp": f"{stat.st_mtime_ns}:{stat.st_size}",
+            }
+        atomic_write_json(manifest_path, {"sources": sources}, ensure_ascii=False, indent=2)
+    return results
+
+
+def sources_with_matches(manifest_path: Path) -> List[str]:
+    """Output files of the sources that had at least one match in the run that wrote manifest_path."""
+    with Path(manifest_path).open("r", encoding="utf-8") as f:
+        sources = json.load(f).get("sources", {})
+    return [entry["output"] for entry in sources.values() if entry.get("matches")]
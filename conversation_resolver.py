@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "conversation_ids.sqlite3"
+
+# Fields returned for a resolved conversation (what callers of find_doc actually used)
+RESOLVED_FIELDS = ["_id", "language", "roles", "farmer_id", "expiry"]
+
+
+def canonical_timestamp(value: Any) -> Optional[str]:
+    """
+    Millisecond-precision UTC ISO string for a message timestamp, whether it is an exported
+    {"$date": "..."} dict, an ISO string or a datetime returned by pymongo.
+    """
+    if isinstance(value, dict):
+        value = value.get("$date")
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def first_user_message(messages: Sequence[Dict]) -> Optional[Dict]:
+    for m in messages:
+        if m.get("role") == "user":
+            return m
+    return None
+
+
+def conversation_fingerprint(messages: Sequence[Dict]) -> Optional[str]:
+    """Stable hash of the first user message's content and timestamp, or None if it has no timestamp."""
+    m = first_user_message(messages)
+    if m is None:
+        return None
+    ts = canonical_timestamp(m.get("timestamp"))
+    if ts is None:
+        return None
+    return hashlib.sha256(f"{m.get('content', '')}\x1f{ts}".encode("utf-8")).hexdigest()
+
+
+def _to_record(doc: Dict) -> Dict:
+    record = {field: doc.get(field) for field in RESOLVED_FIELDS}
+    record["_id"] = str(doc["_id"])
+    return json.loads(json.dumps(record, default=str))
+
+
+class ConversationResolver:
+    """
+    Resolves exported conversations (message arrays without ids) to their Mongo documents.
+
+    Replaces mongo_uri_test.find_doc, which matched the whole embedded messages array and so
+    could not use an index. Conversations are fingerprinted by their first user message
+    (content + timestamp); unknown fingerprints are looked up in bulk with
+    {"messages.timestamp": {"$in": [...]}} (served by an index on messages.timestamp, see
+    create_index) and matched locally. Resolved records are cached on disk, so re-runs do not
+    query Mongo for conversations that were already resolved. Fingerprints that were not found
+    are cached too (as null) so they are not queried again on every run; forget_missing clears them.
+
+    Args:
+        collection: pymongo collection. Defaults to mongo_uri_test.collection, imported only
+            when a lookup actually has to go to Mongo.
+        cache_path: SQLite file for resolved records.
+        chunk_size: Timestamps per $in query.
+    """
+
+    def __init__(self, collection=None, cache_path: Path = DEFAULT_CACHE_PATH, chunk_size: int = 500):
+        self._collection = collection
+        self.chunk_size = chunk_size
+        self.cache_hits = 0
+        self.mongo_queries = 0
+        self._lock = threading.Lock()
+        self.cache_path = Path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.cache_path), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS resolved (fingerprint TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        self._conn.commit()
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            from mongo_uri_test import collection
+            self._collection = collection
+        return self._collection
+
+    def create_index(self) -> str:
+        """Create the messages.timestamp index the bulk lookup relies on. Run once per database."""
+        return self.collection.create_index("messages.timestamp")
+
+    def _cached(self, fingerprints: Sequence[str]) -> Dict[str, Optional[Dict]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(fingerprints), 500):
+                chunk = fingerprints[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for fingerprint, record in self._conn.execute(
+                    f"SELECT fingerprint, record FROM resolved WHERE fingerprint IN ({placeholders})", chunk
+                ):
+                    found[fingerprint] = json.loads(record)
+        return found
+
+    def _store(self, records: Dict[str, Optional[Dict]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO resolved VALUES (?, ?)",
+                [(fingerprint, json.dumps(record, ensure_ascii=False)) for fingerprint, record in records.items()],
+            )
+            self._conn.commit()
+
+    def _query_mongo(self, wanted: Dict[str, datetime]) -> Dict[str, Dict]:
+        """Bulk-fetch documents whose messages contain any of the wanted timestamps and match them by fingerprint."""
+        projection = {field: 1 for field in RESOLVED_FIELDS}
+        # Every message, but only the fields the fingerprint uses: the first user message can be
+        # preceded by any number of assistant/system messages, so a fixed $slice could miss it
+        for field in ("role", "content", "timestamp"):
+            projection[f"messages.{field}"] = 1
+        timestamps = sorted(set(wanted.values()))
+        found: Dict[str, Dict] = {}
+        for start in range(0, len(timestamps), self.chunk_size):
+            chunk = timestamps[start:start + self.chunk_size]
+            self.mongo_queries += 1
+            for doc in self.collection.find({"messages.timestamp": {"$in": chunk}}, projection):
+                fingerprint = conversation_fingerprint(doc.get("messages", []))
+                if fingerprint in wanted and fingerprint not in found:
+                    found[fingerprint] = _to_record(doc)
+        return found
+
+    def resolve_many(self, conversations: Iterable[Sequence[Dict]]) -> List[Optional[Dict]]:
+        """
+        Resolve many message arrays at once.
+
+        Returns:
+            One {"_id": str, "language", "roles", "farmer_id", "expiry"} record (or None if not
+            found) per input, in input order.
+        """
+        conversations = list(conversations)
+        fingerprints = [conversation_fingerprint(messages) for messages in conversations]
+        known = [f for f in dict.fromkeys(fingerprints) if f is not None]
+        resolved = self._cached(known)
+        self.cache_hits += len(resolved)
+
+        wanted: Dict[str, datetime] = {}
+        for fingerprint, messages in zip(fingerprints, conversations):
+            if fingerprint is None or fingerprint in resolved or fingerprint in wanted:
+                continue
+            ts = canonical_timestamp(first_user_message(messages).get("timestamp"))
+            wanted[fingerprint] = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+        if wanted:
+            fetched = self._query_mongo(wanted)
+            # Misses are stored as None, so the next run does not ask Mongo for them again
+            fetched = {fingerprint: fetched.get(fingerprint) for fingerprint in wanted}
+            self._store(fetched)
+            resolved.update(fetched)
+
+        return [resolved.get(f) if f is not None else None for f in fingerprints]
+
+    def resolve(self, messages: Sequence[Dict]) -> Optional[Dict]:
+        return self.resolve_many([messages])[0]
+
+    def forget_missing(self) -> int:
+        """Drop the cached misses so they are looked up again. Returns the number dropped."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM resolved WHERE record = 'null'")
+            self._conn.commit()
+        return cursor.rowcount
+
+    def fetch_by_ids(self, ids: Iterable[Any], fields: Sequence[str]) -> Dict[Any, Dict]:
+        """
+        Fetch documents by _id in chunks of chunk_size with {"_id": {"$in": [...]}}, returning only
+        the requested fields. Returns {_id: doc} for the ids that exist.
+        """
+        ids = [i for i in dict.fromkeys(ids) if i is not None]
+        projection = {field: 1 for field in fields}
+        found: Dict[Any, Dict] = {}
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start + self.chunk_size]
+            self.mongo_queries += 1
+            for doc in self.collection.find({"_id": {"$in": chunk}}, projection):
+                found[doc["_id"]] = doc
+        return found
+
+    def print_stats(self) -> None:
+        print(f"Conversation resolver: {self.cache_hits} cache hits, {self.mongo_queries} Mongo queries")
+
+
+def enrich_by_id(
+    conversations: List[Dict],
+    fields: Sequence[str] = ("language", "expiry"),
+    resolver: Optional[ConversationResolver] = None,
+) -> int:
+    """
+    Copy `fields` from each conversation's Mongo document into the conversation, fetching all
+    ids of the list in a few bulk queries. Returns the number of conversations found.
+    """
+    resolver = resolver or get_resolver()
+    docs = resolver.fetch_by_ids((conv.get("_id") for conv in conversations), ["_id", *fields])
+    found = 0
+    for conv in conversations:
+        doc = docs.get(conv.get("_id"))
+        if doc is None:
+            continue
+        conv["_id"] = doc.get("_id")
+        for field in fields:
+            conv[field] = doc.get(field)
+        found += 1
+    return found
+
+
+_resolver: Optional[ConversationResolver] = None
+
+
+def get_resolver() -> ConversationResolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = ConversationResolver(cache_path=Path(os.getenv("CONVERSATION_ID_CACHE_PATH", str(DEFAULT_CACHE_PATH))))
+    return _resolver
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--create-index" in sys.argv:
+        print(f"Created index {get_resolver().create_index()}")
+    if "--forget-missing" in sys.argv:
+        print(f"Dropped {get_resolver().forget_missing()} cached misses")
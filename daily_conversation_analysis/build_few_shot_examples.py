@@ -14,6 +14,7 @@ The script:
 3. Maintains uniqueness by tracking message content in a set
 4. Rebuilds the few_shot_examples.json file from scratch each run
 5. Preserves the required JSON structure with conversation_id, user_message_index, input, and output
+6. Updates the few-shot vector index of both classifiers (OpenAI and Gemini), embedding only the newly added examples
 
 Usage:
     python3 -m daily_conversation_analysis.build_few_shot_examples
@@ -26,6 +27,24 @@ from pathlib import Path
 from tqdm import tqdm
 
 
+CLASSIFIER_MODULES = [
+    "daily_conversation_analysis.openai_message_classifier",
+    "daily_conversation_analysis.google_gai_message_classifier",
+]
+
+
+def refresh_example_index(few_shot_examples):
+    """Embed new examples into every classifier's few-shot index so the next run starts warm."""
+    import importlib
+
+    for module_name in CLASSIFIER_MODULES:
+        try:
+            importlib.import_module(module_name).get_preclassifier(few_shot_examples)
+            print(f"✓ Updated few-shot example index of {module_name.rsplit('.', 1)[-1]}")
+        except Exception as e:
+            print(f"\nCould not update few-shot example index of {module_name}: {e}")
+
+
 def build_few_shot_examples():
     """Build few-shot examples from historical conversation files."""
     
@@ -127,6 +146,8 @@ def build_few_shot_examples():
     print(f"  Common: {common_count}")
     print(f"  Uncommon: {uncommon_count}")
 
+    refresh_example_index(few_shot_examples)
+
 
 if __name__ == "__main__":
     build_few_shot_examples()
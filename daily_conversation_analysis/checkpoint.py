@@ -0,0 +1,183 @@
+"""
+Append-only checkpoint log for the daily conversation pipeline.
+
+Pipeline stages (standalone questions, transliteration, classification) record the fields they
+add to a message (or conversation) as one JSON line in `<conversations.json>.wal.jsonl` instead
+of re-writing the whole conversations file after every conversation.
+
+On start-up a stage replays the log onto the loaded conversations, so a killed job resumes
+without redoing or losing work. At the end of the stage the log is compacted into
+conversations.json once, using an atomic rename so the file is never left half-written.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+def conversation_key(conversation: Dict[str, Any]) -> str:
+    conv_id = conversation.get("_id")
+    if isinstance(conv_id, dict):
+        conv_id = conv_id.get("$oid")
+    return str(conv_id)
+
+
+def atomic_write_json(path, data, **dump_kwargs) -> None:
+    """Write JSON to a temp file in the same directory, fsync it and rename it over path."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_jsonl_ids(jsonl_path) -> set:
+    """Return the conversation keys already present in a JSONL conversations file."""
+    jsonl_path = Path(jsonl_path)
+    ids = set()
+    if not jsonl_path.exists():
+        return ids
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                ids.add(conversation_key(json.loads(line)))
+            except json.JSONDecodeError:
+                continue
+    return ids
+
+
+def jsonl_to_json_array(jsonl_path, json_path, indent: int = 2) -> int:
+    """
+    Stream a JSONL file of conversations into a JSON array at json_path, one conversation
+    in memory at a time, replacing json_path atomically. Returns the number of conversations written.
+    """
+    json_path = Path(json_path)
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(json_path.parent), prefix=f".{json_path.name}.", suffix=".tmp")
+    count = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out, Path(jsonl_path).open("r", encoding="utf-8") as src:
+            out.write("[")
+            for line in src:
+                try:
+                    conv = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                out.write("," if count else "")
+                out.write("\n" + json.dumps(conv, ensure_ascii=False, indent=indent, default=str))
+                count += 1
+            out.write("\n]" if count else "]")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, json_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+class CheckpointLog:
+    """
+    JSONL write-ahead log of per-message annotations for one conversations.json file.
+
+    Each line is {"conv": <conversation _id>, "msg": <message index or null>, "fields": {...}}.
+    A null message index means the fields belong to the conversation itself.
+
+    Args:
+        json_path: The conversations file the log belongs to.
+        key_fn: Function identifying a conversation; defaults to its _id. Files whose
+            conversations have no _id can pass any other stable key.
+    """
+
+    def __init__(self, json_path, key_fn: Callable[[Dict[str, Any]], str] = conversation_key):
+        self.json_path = Path(json_path)
+        self.key_fn = key_fn
+        self.log_path = self.json_path.with_name(self.json_path.name + ".wal.jsonl")
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _ends_with_partial_line(self) -> bool:
+        if not self.log_path.exists() or self.log_path.stat().st_size == 0:
+            return False
+        with self.log_path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def record(self, conversation: Dict[str, Any], msg_idx: Optional[int], fields: Dict[str, Any]) -> None:
+        line = json.dumps(
+            {"conv": self.key_fn(conversation), "msg": msg_idx, "fields": fields},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock:
+            if self._file is None:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                needs_newline = self._ends_with_partial_line()
+                self._file = self.log_path.open("a", encoding="utf-8")
+                if needs_newline:
+                    self._file.write("\n")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def replay(self, conversations: List[Dict[str, Any]]) -> int:
+        """Apply logged annotations onto conversations in place. Returns the number of entries applied."""
+        if not self.log_path.exists():
+            return 0
+        by_key = {self.key_fn(conv): conv for conv in conversations}
+        applied = 0
+        with self.log_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partially written last line from a killed job; everything before it is intact.
+                    continue
+                conv = by_key.get(entry.get("conv"))
+                if conv is None:
+                    continue
+                msg_idx = entry.get("msg")
+                if msg_idx is None:
+                    conv.update(entry["fields"])
+                else:
+                    messages = conv.get("messages", [])
+                    if msg_idx >= len(messages):
+                        continue
+                    messages[msg_idx].update(entry["fields"])
+                applied += 1
+        if applied:
+            print(f"Replayed {applied} checkpoint entries from {self.log_path.name}")
+        return applied
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def compact(self, conversations: List[Dict[str, Any]]) -> None:
+        """Atomically write conversations to json_path and discard the log."""
+        self.close()
+        atomic_write_json(self.json_path, conversations, ensure_ascii=False, indent=2, default=str)
+        if self.log_path.exists():
+            self.log_path.unlink()
+
+
+def load_conversations_with_checkpoint(json_path):
+    """Load conversations.json and replay any pending checkpoint log onto it."""
+    checkpoint = CheckpointLog(json_path)
+    with Path(json_path).open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    checkpoint.replay(data)
+    return data, checkpoint
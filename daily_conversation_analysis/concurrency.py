@@ -0,0 +1,131 @@
+"""
+Bounded-concurrency helpers for the daily conversation pipeline.
+
+- TokenBucket: thread-safe token-bucket rate limiter used in place of fixed time.sleep() calls
+  between LLM / API requests.
+- run_concurrently: runs a function over a list of items on a thread pool with a fixed number of
+  workers, returning results in input order.
+- iter_concurrently: same, but consumes items lazily from any iterable (e.g. a Mongo cursor) and
+  yields (item, result) pairs as they complete, keeping only a bounded number of items in memory.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from tqdm import tqdm
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter.
+
+    Tokens are refilled continuously at `rate` tokens per second up to `capacity`.
+    `acquire` blocks until the requested number of tokens is available, so callers
+    across all threads together never exceed `rate` requests per second on average,
+    while still allowing short bursts of up to `capacity` requests.
+
+    Args:
+        rate: Tokens added per second. A value <= 0 disables limiting.
+        capacity: Maximum number of tokens in the bucket (burst size). Defaults to max(1, rate).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def run_concurrently(
+    func: Callable[[T], R],
+    items: Sequence[T],
+    max_workers: int = 8,
+    desc: Optional[str] = None,
+    unit: str = "item",
+) -> List[R]:
+    """
+    Apply `func` to every item on a bounded thread pool.
+
+    Args:
+        func: Function called once per item.
+        items: Items to process.
+        max_workers: Maximum number of items processed at the same time.
+        desc: Optional tqdm progress bar description.
+        unit: tqdm unit label.
+
+    Returns:
+        List of results in the same order as `items`. Exceptions raised by `func`
+        are propagated after all submitted work has finished.
+    """
+    results: List[Optional[R]] = [None] * len(items)
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(func, item): i for i, item in enumerate(items)}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc, unit=unit):
+            results[futures[future]] = future.result()
+
+    return results
+
+
+def iter_concurrently(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 8,
+    max_pending: Optional[int] = None,
+) -> Iterator[Tuple[T, R]]:
+    """
+    Apply `func` to items pulled lazily from an iterable on a bounded thread pool.
+
+    At most `max_pending` items (default 2 * max_workers) are pulled from `items` but not yet
+    yielded, so memory stays flat however long the iterable is.
+
+    Yields:
+        (item, result) pairs in completion order. Exceptions raised by `func` are propagated.
+    """
+    max_workers = max(1, max_workers)
+    max_pending = max_pending or 2 * max_workers
+    iterator = iter(items)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = item
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                yield item, future.result()
@@ -0,0 +1,216 @@
+"""
+SQLite-backed conversation store for the Streamlit tools.
+
+A day's conversations.json is imported once into `conversations.sqlite3` next to it, with one row
+per conversation keyed by `_id`. Viewers read single conversations lazily by id and write edits
+back as single-row updates instead of re-serializing the whole day on every button press.
+
+Per-conversation filter flags (all-common, has-untranslated, has-standalone-error,
+response-incorrect, added-to-standalone, language, farmer) are precomputed into an indexed
+`flags` table at import time and refreshed on every update, so filtering a day (or many days)
+is an index lookup instead of a scan over every conversation.
+
+Edits are tracked as dirty rows and written back to conversations.json (atomically) with
+`export_json`, so the pipeline scripts that read the JSON file see them. The JSON file is
+re-imported automatically when it changed on disk and the store has no unexported edits.
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from daily_conversation_analysis.checkpoint import atomic_write_json, conversation_key
+
+
+FLAG_COLUMNS = [
+    "all_common",
+    "has_untranslated",
+    "has_standalone_error",
+    "response_incorrect",
+    "added_to_standalone",
+]
+
+
+def compute_flags(conv: Dict[str, Any]) -> Dict[str, Any]:
+    """Filter flags for one conversation."""
+    user_messages = [m for m in conv.get("messages", []) if (m.get("type") or m.get("role")) == "user"]
+    return {
+        "all_common": bool(user_messages) and all(m.get("is_query_common") is True for m in user_messages),
+        "has_untranslated": any(
+            not (m.get("en") or "").strip() or "transliteration_error" in m for m in user_messages
+        ),
+        "has_standalone_error": "processing_error" in conv or any(
+            "standalone_question_error" in m for m in user_messages
+        ),
+        "response_incorrect": any(m.get("is_response_by_dharti_correct") == "no" for m in user_messages),
+        "added_to_standalone": any(m.get("added_to_standalone_examples") is True for m in user_messages),
+        "language": conv.get("language") or "",
+        "farmer_id": conv.get("farmer_id") or "",
+    }
+
+
+def _flag_row(conv: Dict[str, Any]) -> Tuple:
+    flags = compute_flags(conv)
+    return (conversation_key(conv),) + tuple(int(flags[c]) for c in FLAG_COLUMNS) + (flags["language"], flags["farmer_id"])
+
+
+class ConversationStore:
+    def __init__(self, json_path, db_path=None):
+        self.json_path = Path(json_path)
+        self.db_path = Path(db_path) if db_path else self.json_path.with_suffix(".sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, position INTEGER NOT NULL, data TEXT NOT NULL, dirty INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_position ON conversations (position)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS flags (id TEXT PRIMARY KEY, "
+            + ", ".join(f"{c} INTEGER NOT NULL" for c in FLAG_COLUMNS)
+            + ", language TEXT, farmer_id TEXT)"
+        )
+        for column in FLAG_COLUMNS + ["language", "farmer_id"]:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_flags_{column} ON flags ({column})")
+        self._conn.commit()
+        if not self.sync_from_json():
+            self._backfill_flags()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def pending_edits(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversations WHERE dirty = 1").fetchone()[0]
+
+    def json_changed_on_disk(self) -> bool:
+        if not self.json_path.exists():
+            return False
+        return str(self.json_path.stat().st_mtime_ns) != self._get_meta("json_mtime_ns")
+
+    def sync_from_json(self, force: bool = False) -> bool:
+        """
+        (Re)import conversations.json if it changed since the last import/export.
+        Does nothing while there are unexported edits unless force is set. Returns True if imported.
+        """
+        if not self.json_path.exists() or not (force or self.json_changed_on_disk()):
+            return False
+        if not force and self.pending_edits():
+            print(f"{self.json_path} changed on disk but the store has unexported edits; not re-importing")
+            return False
+
+        print(f"\nimporting conversations from {self.json_path}\n")
+        with self.json_path.open("r", encoding="utf-8") as f:
+            conversations = json.load(f)
+        with self._lock:
+            self._conn.execute("DELETE FROM conversations")
+            self._conn.execute("DELETE FROM flags")
+            self._conn.executemany(self._flags_insert_sql(), [_flag_row(conv) for conv in conversations])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversations (id, position, data, dirty) VALUES (?, ?, ?, 0)",
+                [
+                    (conversation_key(conv), position, json.dumps(conv, ensure_ascii=False, default=str))
+                    for position, conv in enumerate(conversations)
+                ],
+            )
+            self._set_meta("json_mtime_ns", str(self.json_path.stat().st_mtime_ns))
+            self._conn.commit()
+        return True
+
+    def _backfill_flags(self) -> None:
+        """Compute flags for stores imported before the flags table existed."""
+        with self._lock:
+            missing = self._conn.execute(
+                "SELECT c.data FROM conversations c LEFT JOIN flags f ON f.id = c.id WHERE f.id IS NULL"
+            ).fetchall()
+            if missing:
+                self._conn.executemany(self._flags_insert_sql(), [_flag_row(json.loads(data)) for (data,) in missing])
+                self._conn.commit()
+
+    @staticmethod
+    def _flags_insert_sql() -> str:
+        return f"INSERT OR REPLACE INTO flags VALUES ({', '.join('?' * (len(FLAG_COLUMNS) + 3))})"
+
+    def filter_ids(
+        self,
+        include: Optional[Dict[str, bool]] = None,
+        language: Optional[str] = None,
+        farmer_id: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Conversation ids (in file order) matching every given flag value, e.g.
+        filter_ids({"all_common": False, "response_incorrect": True}, language="hi").
+        """
+        clauses, params = [], []
+        for column, value in (include or {}).items():
+            if column not in FLAG_COLUMNS:
+                raise ValueError(f"Unknown flag: {column}")
+            clauses.append(f"f.{column} = ?")
+            params.append(int(value))
+        if language:
+            clauses.append("f.language = ?")
+            params.append(language)
+        if farmer_id:
+            clauses.append("f.farmer_id = ?")
+            params.append(farmer_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT c.id FROM conversations c JOIN flags f ON f.id = c.id {where} ORDER BY c.position",
+                params,
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def distinct_values(self, column: str) -> List[str]:
+        if column not in ("language", "farmer_id"):
+            raise ValueError(f"Unknown column: {column}")
+        with self._lock:
+            rows = self._conn.execute(f"SELECT DISTINCT {column} FROM flags ORDER BY {column}").fetchall()
+        return [row[0] for row in rows if row[0]]
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM conversations ORDER BY position")]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def get(self, conv_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM conversations WHERE id = ?", (str(conv_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_conversations(self) -> Iterator[Dict[str, Any]]:
+        """Yield conversations in file order, one row in memory at a time."""
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM conversations ORDER BY position").fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def update(self, conversation: Dict[str, Any]) -> None:
+        """Persist an edited conversation as a single-row update."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conversations SET data = ?, dirty = 1 WHERE id = ?",
+                (json.dumps(conversation, ensure_ascii=False, default=str), conversation_key(conversation)),
+            )
+            self._conn.execute(self._flags_insert_sql(), _flag_row(conversation))
+            self._conn.commit()
+
+    def export_json(self) -> int:
+        """Write all conversations back to conversations.json atomically. Returns the number of edits written."""
+        edits = self.pending_edits()
+        atomic_write_json(self.json_path, list(self.iter_conversations()), ensure_ascii=False, indent=2)
+        with self._lock:
+            self._conn.execute("UPDATE conversations SET dirty = 0 WHERE dirty = 1")
+            self._set_meta("json_mtime_ns", str(self.json_path.stat().st_mtime_ns))
+            self._conn.commit()
+        return edits
@@ -1,11 +1,17 @@
 # streamlit run daily_conversation_analysis/conversation_viewer.py
 
 import streamlit as st
-import json
+import sys
 from pathlib import Path
 from datetime import datetime
 from standalone_utils import process_and_append_message
 
+dharti_chats_dir = str(Path(__file__).parent.parent)
+if dharti_chats_dir not in sys.path:
+    sys.path.insert(0, dharti_chats_dir)
+
+from daily_conversation_analysis.conversation_store import ConversationStore
+
 st.set_page_config(page_title="Conversation Viewer", layout="wide")
 
 st.markdown("""
@@ -41,49 +47,148 @@ div[data-testid="stChatMessage"] code {
 </style>
 """, unsafe_allow_html=True)
 
-def load_conversations(json_path):
-    print(f"\nloading conversations for {json_path}\n")
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        st.session_state['conversations'] = data
-        return data
-
-def is_conversation_common(conv):
-    messages = conv.get('messages', [])
-    user_messages = [m for m in messages if m.get('role') == 'user']
-    if not user_messages:
-        return False
-    for msg in user_messages:
-        if msg.get('is_query_common') is not True:
-            return False
-    return True
-
-def save_conversations(json_path, conversations):
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(conversations, f, ensure_ascii=False, indent=2)
-
-json_dir = Path(__file__).parent / "19_Nov_2025"
-json_files = [json_dir / "conversations.json"]
-selected_json_file = json_files[0]
-
-st.title(f"📊 Conversation Viewer & Annotator {json_files[0].parent.name}")
-
-if not json_files or not json_files[0].exists():
+DATA_DIR = Path(__file__).parent
+DAY_FOLDER_FORMAT = "%d_%b_%Y"
+
+FLAG_FILTERS = {
+    "all_common": "All messages common",
+    "has_untranslated": "Has untranslated message",
+    "has_standalone_error": "Has standalone error",
+    "response_incorrect": "Response marked incorrect",
+    "added_to_standalone": "Added to standalone examples",
+}
+
+def discover_day_folders():
+    """DD_Mon_YYYY folders with a conversations.json, oldest first."""
+    days = []
+    for folder in DATA_DIR.iterdir():
+        if not (folder / "conversations.json").exists():
+            continue
+        try:
+            days.append((datetime.strptime(folder.name, DAY_FOLDER_FORMAT).date(), folder))
+        except ValueError:
+            continue
+    return sorted(days)
+
+def get_store(day_folder):
+    """One indexed store per day folder, built once and kept for the session."""
+    stores = st.session_state.setdefault('stores', {})
+    if day_folder.name not in stores:
+        stores[day_folder.name] = ConversationStore(day_folder / "conversations.json")
+    return stores[day_folder.name]
+
+@st.cache_resource
+def get_standalone_embedder():
+    """Cached embedder for the near-duplicate check of standalone examples; None skips the check."""
+    try:
+        from daily_conversation_analysis.openai_message_classifier import embed_documents
+    except Exception as e:
+        print(f"Near-duplicate check of standalone examples disabled: {e}")
+        return None
+    return embed_documents
+
+def save_conversation(conv):
+    current_store.update(conv)
+
+def invalidate_filtered_ids():
+    st.session_state.pop('filtered_conversation_ids', None)
+    st.session_state.pop('filter_signature', None)
+
+available_days = discover_day_folders()
+
+if not available_days:
     st.error("No conversations.json files found!")
     st.stop()
 
-if 'conversations' not in st.session_state:
-    conversations = load_conversations(selected_json_file)
-    st.session_state['conversations'] = conversations
-else:
-    conversations = st.session_state['conversations']
+with st.sidebar:
+    st.markdown("### 📅 Days")
+    first_day, last_day = available_days[0][0], available_days[-1][0]
+    selected_range = st.date_input(
+        "Date range:",
+        value=(last_day, last_day),
+        min_value=first_day,
+        max_value=last_day,
+    )
+    if isinstance(selected_range, (tuple, list)):
+        range_start = selected_range[0]
+        range_end = selected_range[1] if len(selected_range) > 1 else selected_range[0]
+    else:
+        range_start = range_end = selected_range
+    day_folders = [folder for day, folder in available_days if range_start <= day <= range_end]
+
+if not day_folders:
+    st.warning("No conversation folders in the selected date range.")
+    st.stop()
 
-if "filtered_conversation_ids" not in st.session_state:
-    filtered_conversation_ids = [c['_id'] for c in conversations if not is_conversation_common(c)]
+stores = {folder.name: get_store(folder) for folder in day_folders}
+
+with st.sidebar:
+    st.markdown("### 🔎 Filters")
+    flag_filters = {}
+    for flag, label in FLAG_FILTERS.items():
+        default = "No" if flag == "all_common" else "Any"
+        choice = st.selectbox(label, options=["Any", "Yes", "No"], index=["Any", "Yes", "No"].index(default), key=f"filter_{flag}")
+        if choice != "Any":
+            flag_filters[flag] = choice == "Yes"
+
+    languages = sorted({lang for s in stores.values() for lang in s.distinct_values("language")})
+    language_filter = st.selectbox("Language:", options=["Any"] + languages)
+    farmers = sorted({farmer for s in stores.values() for farmer in s.distinct_values("farmer_id")})
+    farmer_filter = st.selectbox("Farmer ID:", options=["Any"] + farmers)
+
+    if st.button("🔄 Refresh filtered list"):
+        invalidate_filtered_ids()
+
+    st.markdown("### 💾 Edits")
+    pending_by_day = {name: s.pending_edits() for name, s in stores.items()}
+    pending_edits = sum(pending_by_day.values())
+    st.markdown(f"**Unsaved edits in store:** `{pending_edits}`")
+    if st.button("💾 Write edits to conversations.json", disabled=pending_edits == 0):
+        for name, s in stores.items():
+            if pending_by_day[name]:
+                written = s.export_json()
+                st.success(f"Wrote {written} edited conversations to {name}/conversations.json")
+    changed_days = [name for name, s in stores.items() if s.json_changed_on_disk() and pending_by_day[name]]
+    if changed_days:
+        st.warning(f"conversations.json changed on disk since it was loaded ({', '.join(changed_days)}); write or discard edits to reload it.")
+    if st.button("🔄 Reload from conversations.json (discards unsaved edits)"):
+        for s in stores.values():
+            s.sync_from_json(force=True)
+        invalidate_filtered_ids()
+        st.rerun()
+
+filter_signature = (
+    tuple(stores),
+    tuple(sorted(flag_filters.items())),
+    language_filter,
+    farmer_filter,
+)
+
+# The filtered list is kept stable while annotating (an edit that changes a flag does not make
+# the conversation disappear under the cursor); it is rebuilt when the filters or days change.
+if st.session_state.get('filter_signature') != filter_signature:
+    filtered_conversation_ids = [
+        (day_name, conv_id)
+        for day_name, s in stores.items()
+        for conv_id in s.filter_ids(
+            flag_filters,
+            language=None if language_filter == "Any" else language_filter,
+            farmer_id=None if farmer_filter == "Any" else farmer_filter,
+        )
+    ]
     st.session_state['filtered_conversation_ids'] = filtered_conversation_ids
+    st.session_state['filtered_positions'] = {conv_id: i for i, (_, conv_id) in reversed(list(enumerate(filtered_conversation_ids)))}
+    st.session_state['filter_signature'] = filter_signature
+    st.session_state.current_index = 0
 else:
     filtered_conversation_ids = st.session_state['filtered_conversation_ids']
 
+if len(day_folders) == 1:
+    title_days = day_folders[0].name
+else:
+    title_days = f"{day_folders[0].name} → {day_folders[-1].name} ({len(day_folders)} days)"
+st.title(f"📊 Conversation Viewer & Annotator {title_days}")
+
 total_conversations = len(filtered_conversation_ids)
 
 if total_conversations == 0:
@@ -108,6 +213,17 @@ def update_view_setting(setting_key, widget_key):
 if st.session_state.current_index >= total_conversations:
     st.session_state.current_index = max(0, total_conversations - 1)
 
+with st.sidebar:
+    st.markdown("### 🎯 Jump")
+    jump_to_id = st.text_input("Conversation ID:", key="jump_to_id")
+    if st.button("Go"):
+        position = st.session_state['filtered_positions'].get(jump_to_id.strip())
+        if position is None:
+            st.error("Conversation not in the filtered list.")
+        else:
+            st.session_state.current_index = position
+            st.rerun()
+
 col1, col2, col3 = st.columns([1, 2, 1])
 with col1:
     if st.button("⬅️ Previous", disabled=st.session_state.current_index == 0):
@@ -120,13 +236,10 @@ with col3:
         st.session_state.current_index += 1
         st.rerun()
 
-def find_conversation_by_id(conversation_id):
-    for conv in conversations:
-        if conv['_id'] == conversation_id:
-            return conv
-    return None
-
-conv = find_conversation_by_id(filtered_conversation_ids[st.session_state.current_index])
+current_day, current_conv_id = filtered_conversation_ids[st.session_state.current_index]
+current_store = stores[current_day]
+conv = current_store.get(current_conv_id)
+st.caption(f"📁 {current_day}")
 
 st.markdown("---")
 col_status1, col_status2, col_status3, col_status4 = st.columns([1, 1, 1, 1])
@@ -139,7 +252,7 @@ with col_status2:
     new_status = st.text_input("Update status:", value=current_status, key=f"status_{st.session_state.current_index}")
     if st.button("💾 Save Status"):
         conv['status'] = new_status
-        save_conversations(selected_json_file, conversations)
+        save_conversation(conv)
         st.success("Status saved!")
         st.rerun()
 
@@ -151,7 +264,7 @@ with col_status2:
     new_status = st.text_input("Deep_eval test status:", value=current_status, key=f"deep_eval_test_status_{st.session_state.current_index}")
     if st.button("💾 Save Deep_eval test status"):
         conv['added_to_deep_eval_test'] = new_status
-        save_conversations(selected_json_file, conversations)
+        save_conversation(conv)
         st.success("Deep_eval test status saved!")
         st.rerun()
 
@@ -238,7 +351,7 @@ for idx, msg in enumerate(messages):
                 with correct_translation_col2:
                     if st.button("💾 Save", key=f"correct_translation_save_{st.session_state.current_index}_{idx}"):
                         msg['correct_translation'] = new_correct_translation
-                        save_conversations(selected_json_file, conversations)
+                        save_conversation(conv)
                         st.success("Saved!")
                         st.rerun()
 
@@ -258,12 +371,12 @@ for idx, msg in enumerate(messages):
             with col_common2:
                 if st.button("Tag Common", key=f"tag_common_{st.session_state.current_index}_{idx}"):
                     msg['is_query_common'] = True
-                    save_conversations(selected_json_file, conversations)
+                    save_conversation(conv)
                     st.rerun()
             with col_common3:
                 if st.button("Tag Un-common", key=f"tag_uncommon_{st.session_state.current_index}_{idx}"):
                     msg['is_query_common'] = False
-                    save_conversations(selected_json_file, conversations)
+                    save_conversation(conv)
                     st.rerun()
 
             st.markdown("---")
@@ -286,12 +399,11 @@ for idx, msg in enumerate(messages):
                 button_disabled = already_added or not has_correct_translation
                 if st.button("➕ Add to Standalone", key=f"add_standalone_{st.session_state.current_index}_{idx}", disabled=button_disabled):
                     # Call the utility function
-                    result = process_and_append_message(conv, idx, str(selected_json_file))
+                    result = process_and_append_message(conv, idx, embed_fn=get_standalone_embedder())
                     
                     if result['status'] == 'success':
                         st.success(result['message'])
-                        # Reload conversations to reflect the change
-                        st.session_state['conversations'] = load_conversations(selected_json_file)
+                        save_conversation(conv)
                         st.rerun()
                     else:
                         st.error(result['message'])
@@ -341,7 +453,7 @@ for idx, msg in enumerate(messages):
             #             'wrong_standalone': wrong_standalone,
             #             'expected_output': expected_output
             #         }
-            #         save_conversations(selected_json_file, conversations)
+            #         save_conversation(conv)
             #         st.success("Deep Eval Test Case Saved!")
             #         st.rerun()
 
@@ -377,7 +489,7 @@ for idx, msg in enumerate(messages):
                 )
                 if st.button("💾", key=f"save_response_{st.session_state.current_index}_{idx}"):
                     user_msg['is_response_by_dharti_correct'] = new_response_correct
-                    save_conversations(selected_json_file, conversations)
+                    save_conversation(conv)
                     st.success("✓")
                     st.rerun()
 
@@ -401,7 +513,7 @@ for idx, msg in enumerate(messages):
                 with my_instr_col2:
                     if st.button("💾", key=f"my_instr_save_{st.session_state.current_index}_{idx}"):
                         user_msg['instructions_by_me'] = new_my_instr
-                        save_conversations(selected_json_file, conversations)
+                        save_conversation(conv)
                         st.success("✓")
                         st.rerun()
 
@@ -418,7 +530,7 @@ for idx, msg in enumerate(messages):
                 with ankit_instr_col2:
                     if st.button("💾", key=f"ankit_instr_save_{st.session_state.current_index}_{idx}"):
                         user_msg['instructions_by_ankit_sir'] = new_ankit_instr
-                        save_conversations(selected_json_file, conversations)
+                        save_conversation(conv)
                         st.success("✓")
                         st.rerun()
 
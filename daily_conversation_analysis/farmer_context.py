@@ -0,0 +1,120 @@
+"""
+Per-day cache of farmer context for standalone question generation.
+
+get_farmer_info_2 is keyed by farmer, language and plot set, so every conversation of the same
+farmer on the same day needs the same farmer_info. FarmerContextCache stores both the raw
+farmer_info and the extract_farmer_context_for_prompt output per
+(farmer name, gender, language, sorted plot_ids, date), and prefetches all distinct farmers of
+the day concurrently on a single event loop instead of one asyncio.run per conversation.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+def farmer_key(conversation: Dict[str, Any], day: str) -> Tuple:
+    return (
+        conversation.get("farmer_name", "Unknown"),
+        conversation.get("gender", "Male"),
+        conversation.get("language", "en"),
+        tuple(sorted(conversation.get("farmer_plot_ids", []) or [])),
+        day,
+    )
+
+
+class FarmerContextCache:
+    """
+    Args:
+        fetch_farmer_info: Async function with get_farmer_info_2's signature.
+        extract_context: Function turning farmer_info into the prompt context.
+        day: Date string the cached context belongs to.
+        max_concurrency: Maximum number of farmer info requests in flight while prefetching.
+    """
+
+    def __init__(
+        self,
+        fetch_farmer_info: Callable,
+        extract_context: Callable[[Any], Any],
+        day: str,
+        max_concurrency: int = 8,
+    ):
+        self.fetch_farmer_info = fetch_farmer_info
+        self.extract_context = extract_context
+        self.day = day
+        self.max_concurrency = max_concurrency
+        self._entries: Dict[Tuple, Tuple[Any, Any]] = {}
+        # Misses being fetched right now; other workers wait on the same future
+        self._in_flight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def _fetch(self, key: Tuple) -> Tuple[Any, Any]:
+        farmer_name, gender, language, plot_ids, _ = key
+        farmer_info = await self.fetch_farmer_info(
+            farmer_name=farmer_name,
+            gender=gender,
+            lang=language,
+            plot_ids=list(plot_ids),
+            get_next_stages=True
+        )
+        return farmer_info, self.extract_context(farmer_info)
+
+    async def _prefetch(self, keys) -> None:
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def fetch_one(key):
+            async with semaphore:
+                try:
+                    entry = await self._fetch(key)
+                except Exception as e:
+                    print(f"Error prefetching farmer info for {key[0]}: {e}")
+                    return
+                with self._lock:
+                    self._entries[key] = entry
+
+        await asyncio.gather(*(fetch_one(key) for key in keys))
+
+    def prefetch(self, conversations: Iterable[Dict[str, Any]]) -> int:
+        """Fetch farmer context for every distinct farmer in conversations. Returns the number fetched."""
+        keys = {farmer_key(conv, self.day) for conv in conversations}
+        with self._lock:
+            keys = [key for key in keys if key not in self._entries]
+        if not keys:
+            return 0
+        print(f"Prefetching farmer info for {len(keys)} distinct farmers...")
+        asyncio.run(self._prefetch(keys))
+        return len(keys)
+
+    def get(self, conversation: Dict[str, Any]) -> Tuple[Any, Any]:
+        """Return (farmer_info, prompt_context), fetching on a miss. Concurrent misses for one key share a single fetch."""
+        key = farmer_key(conversation, self.day)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+
+        try:
+            entry = asyncio.run(self._fetch(key))
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = entry
+            del self._in_flight[key]
+        future.set_result(entry)
+        return entry
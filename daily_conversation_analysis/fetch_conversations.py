@@ -1,6 +1,8 @@
 # python3 -m daily_conversation_analysis.fetch_conversations
+# python3 -m daily_conversation_analysis.fetch_conversations --start 2025-11-01 --end 2025-11-30 --workers 4
 
 import os
+import argparse
 import asyncio
 from pymongo import MongoClient
 from datetime import datetime, timedelta, timezone
@@ -10,6 +12,7 @@ import time
 import sys
 from tqdm import tqdm
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 original_cwd = os.getcwd()
 
@@ -37,9 +40,14 @@ from bot_core.embed import Embedder
 from langchain_core.messages import HumanMessage, AIMessage
 from pathlib import Path
 from daily_conversation_analysis.google_gai_message_classifier import classify_messages as classify_messages_gai, normalize_question_counts
-from daily_conversation_analysis.openai_message_classifier import classify_messages
+from daily_conversation_analysis.openai_message_classifier import classify_messages, report_semantic_savings
 from daily_conversation_analysis.build_few_shot_examples import build_few_shot_examples
-from azure_transliterate_non_retrieval import transliterate_text
+from daily_conversation_analysis.concurrency import TokenBucket, iter_concurrently, run_concurrently
+from daily_conversation_analysis.farmer_context import FarmerContextCache
+from daily_conversation_analysis.semantic_classifier import ClassificationLengthError, estimate_tokens
+from daily_conversation_analysis.checkpoint import jsonl_to_json_array, load_conversations_with_checkpoint, read_jsonl_ids
+from azure_transliterate_non_retrieval import transliterate_texts
+from translation_cache import get_cache
 
 os.chdir(original_cwd)
 print(f"Restored working directory to: {original_cwd}")
@@ -51,10 +59,28 @@ folder_date_str = None
 output_dir = None
 json_path = None
 
-def set_date_range():
+STANDALONE_MAX_IN_FLIGHT = int(os.getenv("STANDALONE_MAX_IN_FLIGHT", "8"))
+STANDALONE_REQUESTS_PER_SECOND = float(os.getenv("STANDALONE_REQUESTS_PER_SECOND", "4"))
+TRANSLITERATION_CHECKPOINT_EVERY = 500
+CLASSIFY_BATCH_MAX_MESSAGES = int(os.getenv("CLASSIFY_BATCH_MAX_MESSAGES", "150"))
+CLASSIFY_BATCH_MAX_TOKENS = int(os.getenv("CLASSIFY_BATCH_MAX_TOKENS", "6000"))
+
+FETCH_BATCH_SIZE = int(os.getenv("FETCH_BATCH_SIZE", "200"))
+# Only the heavy agent state is dropped; the viewer and the store read the remaining fields
+# (tags, sentiment, expiry, roles, initial_message, is_active, ...)
+FETCH_PROJECTION = {"chat_state": 0}
+
+FARMER_KEY_PROJECTION = {"farmer_name": 1, "gender": 1, "language": 1, "farmer_plot_ids": 1}
+FARMER_INFO_MAX_IN_FLIGHT = int(os.getenv("FARMER_INFO_MAX_IN_FLIGHT", "8"))
+
+COMPLETE_MARKER = ".pipeline_complete"
+
+def set_date_range(day=None):
+    """Point the pipeline globals at one day (a datetime/date); defaults to yesterday."""
     global start_date_time, end_date_time, folder_date_str, output_dir, json_path
-    start_date_time = datetime.now() - timedelta(days=1)
-    start_date_time = start_date_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    if day is None:
+        day = datetime.now() - timedelta(days=1)
+    start_date_time = datetime(day.year, day.month, day.day)
     end_date_time = start_date_time.replace(hour=23, minute=59, second=59, microsecond=0)
     
     folder_date_str = start_date_time.strftime("%d_%b_%Y")
@@ -72,12 +98,26 @@ def get_mongo_client():
         raise ValueError("FYLLO_MONGO_URI environment variable not set")
     return MongoClient(mongo_uri)
 
-def process_conversation(conversation, embedder):
+def is_conversation_processed(conversation):
+    """True if farmer info is present and every user message already has a standalone question."""
+    return "farmer_info" in conversation and all(
+        "standalone_question" in msg
+        for msg in conversation.get("messages", [])
+        if (msg.get("type") or msg.get("role")) == "user"
+    )
+
+def process_conversation(conversation, embedder, rate_limiter=None, checkpoint=None, farmer_cache=None):
     """
     Process a single conversation: fetch farmer info, preprocess it, 
     and generate standalone questions for user messages.
     
     Skips standalone question generation if it already exists.
+    User messages within a conversation are processed in order so each one sees
+    the full chat history before it. If a rate_limiter (TokenBucket) is given,
+    a token is acquired before every standalone question request.
+    If a checkpoint (CheckpointLog) is given, every result is appended to it as soon
+    as it is produced. If a farmer_cache (FarmerContextCache) is given, farmer info
+    and its prompt context are taken from it instead of being fetched per conversation.
     """
     try:
         farmer_id = conversation.get("farmer_id")
@@ -87,28 +127,34 @@ def process_conversation(conversation, embedder):
         
         plot_ids = conversation.get("farmer_plot_ids", [])
         
+        messages = conversation.get("messages", [])
+        if is_conversation_processed(conversation):
+            return 0, sum(1 for msg in messages if (msg.get("type") or msg.get("role")) == "user")
+
         print(f"Processing conversation for farmer: {farmer_name} ({farmer_id})")
 
-        import asyncio
-        farmer_info = asyncio.run(get_farmer_info_2(
-            farmer_name=farmer_name,
-            gender=gender,
-            lang=language,
-            plot_ids=plot_ids,
-            get_next_stages=True
-        ))
+        if farmer_cache is not None:
+            farmer_info, processed_farmer_info = farmer_cache.get(conversation)
+        else:
+            farmer_info = asyncio.run(get_farmer_info_2(
+                farmer_name=farmer_name,
+                gender=gender,
+                lang=language,
+                plot_ids=plot_ids,
+                get_next_stages=True
+            ))
+            processed_farmer_info = extract_farmer_context_for_prompt(farmer_info)
 
         conversation["farmer_info"] = farmer_info
+        if checkpoint is not None:
+            checkpoint.record(conversation, None, {"farmer_info": farmer_info})
         
-        processed_farmer_info = extract_farmer_context_for_prompt(farmer_info)
-        
-        messages = conversation.get("messages", [])
         chat_history = [] 
         
         standalone_generated = 0
         standalone_skipped = 0
         
-        for msg in messages:
+        for msg_idx, msg in enumerate(messages):
             role = msg.get("type") or msg.get("role")
             content = msg.get("content", "")
             
@@ -118,6 +164,8 @@ def process_conversation(conversation, embedder):
                     print(f"  Skipping standalone question (already exists)")
                 else:
                     try:
+                        if rate_limiter is not None:
+                            rate_limiter.acquire()
                         standalone_question = embedder.generate_standalone_question(
                             query=content,
                             conversational_history=chat_history,
@@ -126,7 +174,8 @@ def process_conversation(conversation, embedder):
                         )
                         msg["standalone_question"] = standalone_question
                         standalone_generated += 1
-                        time.sleep(1)
+                        if checkpoint is not None:
+                            checkpoint.record(conversation, msg_idx, {"standalone_question": standalone_question})
                     except Exception as e:
                         print(f"Error generating standalone question: {e}")
                         msg["standalone_question_error"] = ""
@@ -143,64 +192,138 @@ def process_conversation(conversation, embedder):
         conversation["processing_error"] = str(e)
         return 0, 0
 
-def fetch_and_process_conversations():
-    client = get_mongo_client()
-    db = client["chat_database"]
-    collection = db["conversations"]
+def stream_conversations_to_jsonl(collection, embedder, rate_limiter, jsonl_path, farmer_cache=None):
+    """
+    Stream the day's conversations from Mongo straight into processing and onto disk.
+
+    The cursor is iterated with FETCH_BATCH_SIZE and FETCH_PROJECTION, each conversation is
+    handed to the worker pool as it arrives and appended to jsonl_path as soon as it is processed,
+    so peak memory stays flat regardless of how many conversations the date range holds.
+    Conversations already present in jsonl_path (from an interrupted run) are skipped.
+    If a farmer_cache is given, the distinct farmers of the day are prefetched first with a
+    small projection query.
+
+    Returns (fetched, generated, skipped) counts for this run.
+    """
+    query = {
+        "messages.timestamp": {
+            "$gte": start_date_time,
+            "$lt": end_date_time
+        }
+    }
+
+    done_ids = read_jsonl_ids(jsonl_path)
+    if done_ids:
+        print(f"Resuming: {len(done_ids)} conversations already exported to {jsonl_path}")
+
+    if farmer_cache is not None:
+        farmer_cursor = collection.find(query, FARMER_KEY_PROJECTION).batch_size(FETCH_BATCH_SIZE)
+        farmer_cache.prefetch(conv for conv in farmer_cursor if str(conv.get("_id")) not in done_ids)
+
+    cursor = collection.find(query, FETCH_PROJECTION).batch_size(FETCH_BATCH_SIZE)
+    new_conversations = (conv for conv in cursor if str(conv.get("_id")) not in done_ids)
+
+    fetched = 0
+    total_generated = 0
+    total_skipped = 0
+    out = None
+    try:
+        for conv, (generated, skipped) in tqdm(
+            iter_concurrently(
+                lambda conv: process_conversation(conv, embedder, rate_limiter, farmer_cache=farmer_cache),
+                new_conversations,
+                max_workers=STANDALONE_MAX_IN_FLIGHT,
+            ),
+            desc="Standalone questions",
+            unit="conv",
+        ):
+            # Opened on the first conversation, so an empty day leaves no file behind
+            if out is None:
+                out = open(jsonl_path, "a", encoding="utf-8")
+            out.write(json.dumps(conv, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            fetched += 1
+            total_generated += generated
+            total_skipped += skipped
+    finally:
+        if out is not None:
+            out.close()
+
+    return fetched, total_generated, total_skipped
 
+def fetch_and_process_conversations():
     print(f"Fetching conversations for: {start_date_time.date()}")
     print(f"Time range (UTC): {start_date_time} to {end_date_time}")
 
     os.makedirs(output_dir, exist_ok=True)
 
-    if os.path.exists(json_path):
-        print(f"Found existing file: {json_path}")
-        print("Loading existing conversations from file...")
-        with open(json_path, "r", encoding="utf-8") as f:
-            conversations = json.load(f)
-        print(f"Loaded {len(conversations)} conversations from file.")
-    else:
-        print("No existing file found. Fetching from database...")
-        query = {
-            "messages.timestamp": {
-                "$gte": start_date_time,
-                "$lt": end_date_time
-            }
-        }
-
-        cursor = collection.find(query, {"chat_state": 0})
-        conversations = list(cursor)
-        
-        print(f"Found {len(conversations)} conversations from database.")
+    print("Initializing Embedder...")
+    embedder = Embedder()
+    print("Embedder initialized.")
 
-        if not conversations:
+    rate_limiter = TokenBucket(STANDALONE_REQUESTS_PER_SECOND)
+    print(f"Processing with {STANDALONE_MAX_IN_FLIGHT} workers at {STANDALONE_REQUESTS_PER_SECOND} requests/sec")
+
+    farmer_cache = FarmerContextCache(
+        get_farmer_info_2,
+        extract_farmer_context_for_prompt,
+        day=start_date_time.strftime("%Y-%m-%d"),
+        max_concurrency=FARMER_INFO_MAX_IN_FLIGHT,
+    )
+
+    if not os.path.exists(json_path):
+        print("No existing file found. Streaming from database...")
+        client = get_mongo_client()
+        collection = client["chat_database"]["conversations"]
+        jsonl_path = os.path.join(output_dir, "conversations.jsonl")
+
+        fetched, total_generated, total_skipped = stream_conversations_to_jsonl(
+            collection, embedder, rate_limiter, jsonl_path, farmer_cache
+        )
+        print(f"Fetched {fetched} conversations from database.")
+        print(f"\nTotal: Generated {total_generated} standalone questions, skipped {total_skipped}\n")
+
+        if not os.path.exists(jsonl_path) or os.path.getsize(jsonl_path) == 0:
+            if os.path.exists(jsonl_path):
+                os.remove(jsonl_path)
             print("No conversations found for yesterday.")
             return
 
-    print("Initializing Embedder...")
-    embedder = Embedder()
-    print("Embedder initialized.")
+        count = jsonl_to_json_array(jsonl_path, json_path)
+        os.remove(jsonl_path)
+        print(f"Saved {count} conversations to: {json_path}")
+        return
 
-    total_generated = 0
-    total_skipped = 0
-    for conv in conversations:
-        generated, skipped = process_conversation(conv, embedder)
-        total_generated += generated
-        total_skipped += skipped
+    print(f"Found existing file: {json_path}")
+    print("Loading existing conversations from file...")
+    conversations, checkpoint = load_conversations_with_checkpoint(json_path)
+    print(f"Loaded {len(conversations)} conversations from file.")
+
+    farmer_cache.prefetch(conv for conv in conversations if not is_conversation_processed(conv))
+
+    results = run_concurrently(
+        lambda conv: process_conversation(conv, embedder, rate_limiter, checkpoint, farmer_cache),
+        conversations,
+        max_workers=STANDALONE_MAX_IN_FLIGHT,
+        desc="Standalone questions",
+        unit="conv",
+    )
+    total_generated = sum(generated for generated, _ in results)
+    total_skipped = sum(skipped for _, skipped in results)
     
     print(f"\nTotal: Generated {total_generated} standalone questions, skipped {total_skipped}\n")
     
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(conversations, f, ensure_ascii=False, indent=2, default=str)
+    checkpoint.compact(conversations)
     
     print(f"Saved conversations to: {json_path}")
 
 def transliterate_conversations() -> None:
     """Read a conversations JSON file, transliterate each message, and save back.
 
-    The function loads the JSON file, iterates over each conversation's
-    messages list and adds a new key 'content_transliterated' containing the
-    transliteration of the original content using Azure's transliteration API.
+    The function loads the JSON file, collects every message across all
+    conversations and adds a new key 'content_transliterated' containing the
+    transliteration of the original content using batched Azure detect and
+    transliterate requests.
     
     Skips messages that already have 'content_transliterated'.
 
@@ -213,12 +336,12 @@ def transliterate_conversations() -> None:
     if not path.is_file():
         raise FileNotFoundError(f"Conversations file not found: {json_path}")
 
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    data, checkpoint = load_conversations_with_checkpoint(path)
 
     total_messages = 0
     total_transliterated = 0
     total_skipped_existing = 0
+    pending = []
 
     for conv_idx, conv in enumerate(data):
         messages = conv.get("messages", [])
@@ -229,38 +352,99 @@ def transliterate_conversations() -> None:
                 
                 if "content_transliterated" in msg:
                     total_skipped_existing += 1
-                    print(f"  Conv {conv_idx+1}, Msg {msg_idx+1}: Skipped (already transliterated)")
                     continue
                 
-                try:
-                    transliterated = transliterate_text(original)
-                    time.sleep(1)
-                    if transliterated and transliterated != original:
-                        msg["content_transliterated"] = transliterated
-                        total_transliterated += 1
-                        print(f"  Conv {conv_idx+1}, Msg {msg_idx+1}: Transliterated")
-                    elif transliterated is None:
-                        print(f"  Conv {conv_idx+1}, Msg {msg_idx+1}: Skipped (English/unsupported)")
-                except Exception as e:
-                    msg["transliteration_error"] = ""
-                    print(f"  Conv {conv_idx+1}, Msg {msg_idx+1}: Error - {e}")
-
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+                pending.append((conv_idx, msg_idx, msg))
+
+    print(f"Transliterating {len(pending)} messages in batches...")
+    for start in range(0, len(pending), TRANSLITERATION_CHECKPOINT_EVERY):
+        chunk = pending[start:start + TRANSLITERATION_CHECKPOINT_EVERY]
+        try:
+            transliterations = transliterate_texts([msg["content"] for _, _, msg in chunk])
+        except Exception as e:
+            print(f"  Batch transliteration error - {e}")
+            transliterations = None
+
+        for i, (conv_idx, msg_idx, msg) in enumerate(chunk):
+            if transliterations is None:
+                msg["transliteration_error"] = ""
+                continue
+            original = msg["content"]
+            transliterated = transliterations[i]
+            if transliterated and transliterated != original:
+                msg["content_transliterated"] = transliterated
+                checkpoint.record(data[conv_idx], msg_idx, {"content_transliterated": transliterated})
+                total_transliterated += 1
+            elif transliterated is None:
+                print(f"  Conv {conv_idx+1}, Msg {msg_idx+1}: Skipped (English/unsupported)")
+
+    checkpoint.compact(data)
 
     print(f"\nCompleted: {total_transliterated}/{total_messages} messages transliterated")
     print(f"Skipped {total_skipped_existing} messages (already transliterated)")
+    get_cache().print_stats()
     print(f"Saved to: {json_path}")
 
+def build_classification_batches(items, max_messages=CLASSIFY_BATCH_MAX_MESSAGES, max_tokens=CLASSIFY_BATCH_MAX_TOKENS):
+    """Split (conv_idx, msg_idx, content) items into batches bounded by message count and estimated tokens."""
+    batches = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item[2])
+        if current and (len(current) >= max_messages or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def classify_batch(batch, on_result, on_error):
+    """
+    Classify one batch with a single structured-output call. If the model returns a list of the
+    wrong length, the batch is split in half and retried so results never get misaligned.
+
+    Every (sub-)batch is reported as soon as it finishes, so a failure in one half of a split
+    batch does not lose the labels the other half already got.
+
+    Args:
+        batch: (conv_idx, msg_idx, content) items.
+        on_result: Called with (sub_batch, classifications) for every classified sub-batch.
+        on_error: Called with (sub_batch, exception) for every sub-batch that failed.
+    """
+    try:
+        classifications = classify_messages([content for _, _, content in batch])
+        if len(classifications) != len(batch):
+            raise ClassificationLengthError(len(batch), len(classifications))
+    except ClassificationLengthError as e:
+        if len(batch) == 1:
+            on_error(batch, e)
+            return
+        print(f"\n  {e} for a batch of {len(batch)} messages, splitting batch")
+        middle = len(batch) // 2
+        classify_batch(batch[:middle], on_result, on_error)
+        classify_batch(batch[middle:], on_result, on_error)
+        return
+    except Exception as e:
+        on_error(batch, e)
+        return
+    on_result(batch, classifications)
+
 def classify_user_messages() -> None:
     """Read conversations JSON file, classify user messages, and save back.
     
-    The function loads the JSON file, iterates over each conversation,
-    collects all user messages, uses classify_messages to get classifications,
-    and stores the results back in the conversation's user messages objects.
+    The function loads the JSON file, collects every unclassified user message
+    across all conversations, packs them into batches of up to
+    CLASSIFY_BATCH_MAX_MESSAGES messages / CLASSIFY_BATCH_MAX_TOKENS estimated
+    tokens, classifies each batch with one classify_messages call and scatters
+    the results back by (conversation index, message index).
     
-    Saves after processing each conversation. Skips conversations where all
-    user messages are already tagged. Skips individual messages that are already tagged.
+    Appends each (sub-)batch's results to the checkpoint log as soon as they are
+    classified and compacts the log into the JSON file once at the end. Skips
+    individual messages that are already tagged.
     
     Args:
         json_path: Absolute path to the conversations.json file.
@@ -270,19 +454,11 @@ def classify_user_messages() -> None:
     if not path.is_file():
         raise FileNotFoundError(f"Conversations file not found: {json_path}")
     
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    print(f"\nClassifying user messages in {len(data)} conversations...")
+    data, checkpoint = load_conversations_with_checkpoint(path)
     
-    for conv_idx in tqdm(range(len(data)), desc="Classifying conversations", unit="conv"):
-        conv = data[conv_idx]
-        messages = conv.get("messages", [])
-        
-        user_messages_to_classify = []
-        user_message_indices = []
-        
-        for msg_idx, msg in enumerate(messages):
+    pending = []
+    for conv_idx, conv in enumerate(data):
+        for msg_idx, msg in enumerate(conv.get("messages", [])):
             role = msg.get("type") or msg.get("role")
             if role == "user":
                 if "is_query_common" in msg:
@@ -290,27 +466,29 @@ def classify_user_messages() -> None:
 
                 content = msg.get("content", "")
                 if content and content.strip():
-                    user_messages_to_classify.append(content)
-                    user_message_indices.append(msg_idx)
-        
-        if not user_messages_to_classify:
-            continue
-        
-        try:
-            classifications = classify_messages(user_messages_to_classify)
-            
-            for i, msg_idx in enumerate(user_message_indices):
-                messages[msg_idx]["is_query_common"] = (classifications[i] == "common")
-            
-            with path.open("w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-            
-        except Exception as e:
-            print(f"\n  Conv {conv_idx+1}: Classification error - {e}")
-            for msg_idx in user_message_indices:
-                messages[msg_idx]["is_query_common_error"] = str(e)
+                    pending.append((conv_idx, msg_idx, content))
+    
+    batches = build_classification_batches(pending)
+    print(f"\nClassifying {len(pending)} user messages from {len(data)} conversations in {len(batches)} batches...")
+    
+    def record_result(sub_batch, classifications):
+        for (conv_idx, msg_idx, _), classification in zip(sub_batch, classifications):
+            msg = data[conv_idx]["messages"][msg_idx]
+            msg["is_query_common"] = (classification == "common")
+            checkpoint.record(data[conv_idx], msg_idx, {"is_query_common": msg["is_query_common"]})
+
+    def record_error(sub_batch, error):
+        print(f"\n  Batch of {len(sub_batch)} messages: Classification error - {error}")
+        for conv_idx, msg_idx, _ in sub_batch:
+            data[conv_idx]["messages"][msg_idx]["is_query_common_error"] = str(error)
+
+    for batch in tqdm(batches, desc="Classifying batches", unit="batch"):
+        classify_batch(batch, record_result, record_error)
+    
+    checkpoint.compact(data)
     
     print(f"\nCompleted classification.")
+    report_semantic_savings()
     print(f"Results saved to: {json_path}")
 
 def analyze_most_asked_questions() -> None:
@@ -373,9 +551,11 @@ def analyze_most_asked_questions() -> None:
         print(f"{category:<25} | {count:>5} | {question}")
     print("-" * 120)
 
-if __name__ == "__main__":
-    set_date_range()
-    
+def is_day_complete(day_output_dir):
+    return os.path.exists(os.path.join(day_output_dir, COMPLETE_MARKER))
+
+def run_pipeline():
+    """Run fetch -> standalone -> transliterate -> classify -> analyze for the current date range."""
     fetch_and_process_conversations()
     
     if os.path.exists(json_path):
@@ -386,6 +566,60 @@ if __name__ == "__main__":
         classify_user_messages()
         
         analyze_most_asked_questions()
-        # pass
+
+        with open(os.path.join(output_dir, COMPLETE_MARKER), "w", encoding="utf-8") as f:
+            f.write(datetime.now().isoformat())
     else:
         print(f"No conversations file found at {json_path}")
+
+def run_day(day_str):
+    """Process-pool entry point: run the whole pipeline for one YYYY-MM-DD day."""
+    set_date_range(datetime.strptime(day_str, "%Y-%m-%d"))
+    run_pipeline()
+    return day_str, is_day_complete(output_dir)
+
+def run_backfill(start, end, workers=2, force=False):
+    """Run the pipeline for every day in [start, end] on a process pool, skipping completed days."""
+    days = []
+    day = start
+    while day <= end:
+        day_output_dir = os.path.join(script_dir, day.strftime("%d_%b_%Y"))
+        if not force and is_day_complete(day_output_dir):
+            print(f"Skipping {day.date()} (already complete)")
+        else:
+            days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+
+    if not days:
+        print("Nothing to do.")
+        return
+
+    print(f"Backfilling {len(days)} days with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run_day, day_str): day_str for day_str in days}
+        for future in as_completed(futures):
+            day_str = futures[future]
+            try:
+                _, complete = future.result()
+                print(f"Day {day_str}: {'complete' if complete else 'no conversations'}")
+            except Exception as e:
+                print(f"Day {day_str}: failed - {e}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Daily conversation analysis pipeline")
+    parser.add_argument("--start", help="First day to process (YYYY-MM-DD). Defaults to yesterday.")
+    parser.add_argument("--end", help="Last day to process (YYYY-MM-DD). Defaults to --start.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of days processed in parallel.")
+    parser.add_argument("--force", action="store_true", help="Re-run days that are already complete.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.start:
+        start = datetime.strptime(args.start, "%Y-%m-%d")
+        end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else start
+        run_backfill(start, end, workers=args.workers, force=args.force)
+    else:
+        set_date_range()
+        run_pipeline()
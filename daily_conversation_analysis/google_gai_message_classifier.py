@@ -17,11 +17,15 @@ This batch processing design helps minimize token usage and optimize classificat
 """
 
 
-from google.generativeai import configure, GenerativeModel, types
+from google.generativeai import configure, GenerativeModel, types, embed_content
 import json
 import os
 from dotenv import load_dotenv, find_dotenv
 import time
+from pathlib import Path
+from embedding_cache import get_embedding_cache
+from daily_conversation_analysis.question_clustering import embed_in_batches, cluster_by_similarity
+from daily_conversation_analysis.semantic_classifier import FewShotClassifier
 
 env_path = "/Users/ashutosh1/Documents/ATT03251.env"
 
@@ -31,6 +35,21 @@ configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 model = GenerativeModel("gemini-2.5-pro")
 
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_BATCH_SIZE = 100
+CLUSTER_SIMILARITY_THRESHOLD = 0.85
+NORMALIZE_BATCH_SIZE = 150
+QUESTION_CATEGORIES = [
+    "water/irrigation",
+    "nutrient/fertigation",
+    "disease/pest",
+    "disease/pest-spray",
+    "weather/forecast",
+    "historical data",
+    "complaints",
+    "others",
+]
+
 def load_few_shot_examples(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -47,9 +66,10 @@ def build_prompt(messages, few_shot_examples):
     prompt_parts.append("Respond only with a JSON list of classification keys (strings: 'common' or 'uncommon'), matching the input order.")
     return "\n".join(prompt_parts)
 
-def classify_messages(messages, few_shot_examples=None):
-    if not few_shot_examples:
-        few_shot_examples = load_few_shot_examples(os.path.join(os.path.dirname(os.path.abspath(__file__)), "few_shot_examples", "few_shot_examples.json"))
+FEW_SHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "few_shot_examples")
+EXAMPLE_VECTORS_PATH = Path(FEW_SHOT_DIR) / "few_shot_examples.text-embedding-004.npz"
+
+def llm_classify_messages(messages, few_shot_examples):
     prompt = build_prompt(messages, few_shot_examples)
     response = model.generate_content(
         prompt,
@@ -61,17 +81,24 @@ def classify_messages(messages, few_shot_examples=None):
     time.sleep(30)
     return json.loads(response.text)
 
-def normalize_question_counts(counts_dict):
+few_shot_classifier = FewShotClassifier(
+    lambda texts: embed_texts(texts, task_type="semantic_similarity"),
+    EXAMPLE_VECTORS_PATH,
+    llm_classify_messages,
+)
+get_preclassifier = few_shot_classifier.get_preclassifier
+report_semantic_savings = few_shot_classifier.report_savings
+
+def classify_messages(messages, few_shot_examples=None, use_semantic_cache=True):
     """
-    Takes a dictionary of {question: count}, normalizes the questions to their base form using LLM,
-    and returns a dictionary with structure: {base_question: {"count": int, "category": str}}
+    Classify messages as 'common' / 'uncommon', labeling near-duplicates of a few-shot example
+    locally (see FewShotClassifier.classify).
     """
-    questions = list(counts_dict.keys())
-    
-    if not questions:
-        return {}
+    if not few_shot_examples:
+        few_shot_examples = load_few_shot_examples(os.path.join(FEW_SHOT_DIR, "few_shot_examples.json"))
+    return few_shot_classifier.classify(messages, few_shot_examples, use_semantic_cache)
 
-    prompt = """
+NORMALIZE_PROMPT = """
     You are an expert data analyst. Your task is to normalize a list of user questions into their standard base forms and categorize them.
     Many questions are semantically identical but phrased differently or in different languages/transliterations.
     Group them by mapping each original question to a single, standard English base question and assign a category.
@@ -124,39 +151,84 @@ def normalize_question_counts(counts_dict):
     
     Questions:
     """
-    
+
+def embed_texts(texts, task_type="clustering"):
+    """Embed texts through the persistent embedding cache (vectors depend on task_type, so it is part of the key)."""
+    cache = get_embedding_cache(f"{EMBEDDING_MODEL}:{task_type}")
+    return cache.embed(
+        texts,
+        lambda batch: embed_content(model=EMBEDDING_MODEL, content=batch, task_type=task_type)["embedding"],
+        batch_size=EMBEDDING_BATCH_SIZE,
+    )
+
+def name_questions(questions):
+    """
+    Ask the LLM to map each question to a standard English base question and a category.
+    Returns {question: {"base_question": str, "category": str}}.
+    """
+    prompt = NORMALIZE_PROMPT
     for q in questions:
         prompt += f"- {q}\n"
-        
+
+    response = model.generate_content(
+        prompt,
+        generation_config={
+            "response_mime_type": "application/json"
+        }
+    )
+    return json.loads(response.text)
+
+def normalize_question_counts(counts_dict):
+    """
+    Takes a dictionary of {question: count}, normalizes the questions to their base form
+    and returns a dictionary with structure: {base_question: {"count": int, "category": str}}
+
+    Questions are embedded and clustered locally (see question_clustering); only the most
+    frequent question of each cluster is sent to the LLM for naming and categorisation,
+    NORMALIZE_BATCH_SIZE representatives per call. A failed LLM batch falls back to the
+    representative itself with category "others" while keeping the cluster grouping.
+    """
+    questions = list(counts_dict.keys())
+    
+    if not questions:
+        return {}
+
+    counts = [counts_dict[q] for q in questions]
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "response_mime_type": "application/json"
-            }
-        )
-        
-        mapping = json.loads(response.text)
-
-        print(f"mapping predicted by LLM: \n{mapping}\n")
-        
-        # Aggregate counts by base question
-        result = {}
-        for original_q, count in counts_dict.items():
-            mapped = mapping.get(original_q, {"base_question": original_q, "category": "others"})
-            base_q = mapped["base_question"]
-            category = mapped["category"]
-            
-            if base_q not in result:
-                result[base_q] = {"count": 0, "category": category}
-            result[base_q]["count"] += count
-            
-        return result
-        
+        vectors = embed_in_batches(questions, embed_texts, batch_size=EMBEDDING_BATCH_SIZE)
+        clusters = cluster_by_similarity(vectors, counts, threshold=CLUSTER_SIMILARITY_THRESHOLD)
     except Exception as e:
-        print(f"Error in normalizing questions: {e}")
-        # Fallback to original format
-        return {q: {"count": c, "category": "others"} for q, c in counts_dict.items()}
+        print(f"Error clustering questions: {e}")
+        clusters = [[i] for i in sorted(range(len(questions)), key=lambda i: -counts[i])]
+
+    representatives = [questions[cluster[0]] for cluster in clusters]
+    print(f"Clustered {len(questions)} questions into {len(clusters)} clusters")
+
+    mapping = {}
+    for start in range(0, len(representatives), NORMALIZE_BATCH_SIZE):
+        batch = representatives[start:start + NORMALIZE_BATCH_SIZE]
+        try:
+            mapping.update(name_questions(batch))
+        except Exception as e:
+            print(f"Error in normalizing questions: {e}")
+
+    print(f"mapping predicted by LLM: \n{mapping}\n")
+
+    result = {}
+    for cluster, representative in zip(clusters, representatives):
+        mapped = mapping.get(representative)
+        if not isinstance(mapped, dict):
+            mapped = {}
+        base_q = mapped.get("base_question") or representative
+        category = mapped.get("category")
+        if category not in QUESTION_CATEGORIES:
+            category = "others"
+
+        if base_q not in result:
+            result[base_q] = {"count": 0, "category": category}
+        result[base_q]["count"] += sum(counts[i] for i in cluster)
+
+    return result
 
 if __name__ == "__main__":
     few_shot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "few_shot_examples", "few_shot_examples.json")
@@ -2,7 +2,7 @@
 # streamlit run daily_conversation_analysis/message_classification_editor.py
 
 import streamlit as st
-import json
+import sys
 from pathlib import Path
 
 # Page config
@@ -53,66 +53,105 @@ div[data-testid="stChatMessage"] code {
 </style>
 """, unsafe_allow_html=True)
 
-# Load conversations from JSON
-def load_conversations(json_path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+dharti_chats_dir = str(Path(__file__).parent.parent)
+if dharti_chats_dir not in sys.path:
+    sys.path.insert(0, dharti_chats_dir)
 
-def save_conversations(json_path, conversations):
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(conversations, f, ensure_ascii=False, indent=2, default=str)
+from daily_conversation_analysis.conversation_store import ConversationStore
+from daily_conversation_analysis.checkpoint import conversation_key
 
-def collect_user_messages(conversations, filter_common=True):
+PAGE_SIZES = [25, 50, 100, 200]
+
+def collect_user_messages(conversations):
     """
     Collect all user messages with their context.
     
     Args:
-        conversations: List of conversation objects
-        filter_common: If True, only return common messages. If False, only uncommon (including unclassified).
+        conversations: Iterable of conversation objects
     
     Returns:
-        List of dicts with: conv_index, msg_index, conv_id, original, standalone, is_common
+        List of dicts with: conv_id, msg_index, original, standalone, is_common
     """
     user_messages = []
     
-    for conv_idx, conv in enumerate(conversations):
-        conv_id = conv.get('_id', {})
-        if isinstance(conv_id, dict):
-            conv_id = conv_id.get('$oid', 'unknown')
-        
-        messages = conv.get('messages', [])
+    for conv in conversations:
+        conv_id = conversation_key(conv)
         
-        for msg_idx, msg in enumerate(messages):
+        for msg_idx, msg in enumerate(conv.get('messages', [])):
             role = msg.get('type') or msg.get('role')
             
             if role == 'user':
-                is_common = msg.get('is_query_common')
-                
-                # For common view: only show messages explicitly tagged as common
-                if filter_common:
-                    if is_common is True:
-                        user_messages.append({
-                            'conv_index': conv_idx,
-                            'msg_index': msg_idx,
-                            'conv_id': conv_id,
-                            'original': msg.get('content', 'N/A'),
-                            'standalone': msg.get('standalone_question', 'N/A'),
-                            'is_common': is_common
-                        })
-                # For uncommon view: show messages tagged as uncommon OR unclassified (missing/null)
-                else:
-                    if is_common is False or is_common is None or 'is_query_common' not in msg:
-                        user_messages.append({
-                            'conv_index': conv_idx,
-                            'msg_index': msg_idx,
-                            'conv_id': conv_id,
-                            'original': msg.get('content', 'N/A'),
-                            'standalone': msg.get('standalone_question', 'N/A'),
-                            'is_common': is_common
-                        })
+                user_messages.append({
+                    'conv_id': conv_id,
+                    'msg_index': msg_idx,
+                    'original': msg.get('content', 'N/A'),
+                    'standalone': msg.get('standalone_question', 'N/A'),
+                    'is_common': msg.get('is_query_common')
+                })
     
     return user_messages
 
+def filter_messages(user_messages, filter_common=True):
+    """
+    For common view: only messages explicitly tagged as common.
+    For uncommon view: messages tagged as uncommon OR unclassified (missing/null).
+    """
+    if filter_common:
+        return [m for m in user_messages if m['is_common'] is True]
+    return [m for m in user_messages if m['is_common'] is not True]
+
+def message_key(msg_data):
+    return (msg_data['conv_id'], msg_data['msg_index'])
+
+def effective_tag(msg_data):
+    return st.session_state.pending_tags.get(message_key(msg_data), msg_data['is_common'])
+
+def select_widget_key(key):
+    return f"select_{key[0]}_{key[1]}"
+
+def set_selected(key, selected):
+    if selected:
+        st.session_state.selected_keys.add(key)
+    else:
+        st.session_state.selected_keys.discard(key)
+    st.session_state[select_widget_key(key)] = selected
+
+def set_tags(keys, value):
+    """Buffer a tag change; nothing is written until the pending edits are flushed."""
+    for key in keys:
+        st.session_state.pending_tags[key] = value
+        set_selected(key, False)
+
+def toggle_selected(key):
+    set_selected(key, st.session_state[select_widget_key(key)])
+
+def select_page(keys, selected):
+    for key in keys:
+        set_selected(key, selected)
+
+def flush_pending_tags(store):
+    """Apply buffered tags as one delta: one row update per touched conversation, then one JSON write."""
+    by_conversation = {}
+    for (conv_id, msg_idx), value in st.session_state.pending_tags.items():
+        by_conversation.setdefault(conv_id, {})[msg_idx] = value
+
+    for conv_id, tags in by_conversation.items():
+        conv = store.get(conv_id)
+        if conv is None:
+            continue
+        for msg_idx, value in tags.items():
+            conv['messages'][msg_idx]['is_query_common'] = value
+        store.update(conv)
+    store.export_json()
+
+    for msg_data in st.session_state.user_messages:
+        key = message_key(msg_data)
+        if key in st.session_state.pending_tags:
+            msg_data['is_common'] = st.session_state.pending_tags[key]
+    written = len(st.session_state.pending_tags)
+    st.session_state.pending_tags = {}
+    return written, len(by_conversation)
+
 # Title
 st.title("🏷️ Message Classification Editor")
 
@@ -122,18 +161,32 @@ json_path = json_dir / "conversations.json"
 
 if not json_path.exists():
     st.error(f"No conversations.json found at: {json_path}")
-    st.info("Edit line 107 in the code to change the date folder.")
+    st.info("Edit json_dir in the code to change the date folder.")
     st.stop()
 
 # Display current file
 st.info(f"📁 Editing: `{json_path.parent.name}/conversations.json`")
 
-# Load conversations
-if 'conversations' not in st.session_state or st.session_state.get('last_file') != str(json_path):
-    st.session_state.conversations = load_conversations(json_path)
+# Load conversations once per file; the message index is rebuilt only on reload
+if st.session_state.get('last_file') != str(json_path):
+    st.session_state.store = ConversationStore(json_path)
+    st.session_state.user_messages = collect_user_messages(st.session_state.store.iter_conversations())
+    st.session_state.pending_tags = {}
+    st.session_state.selected_keys = set()
     st.session_state.last_file = str(json_path)
 
-conversations = st.session_state.conversations
+store = st.session_state.store
+
+# Pending edits
+with st.sidebar:
+    pending_count = len(st.session_state.pending_tags)
+    st.markdown(f"**Pending edits:** `{pending_count}`")
+    if st.button("💾 Save pending edits", disabled=pending_count == 0, type="primary"):
+        written, conversations_touched = flush_pending_tags(store)
+        st.success(f"✓ Saved {written} tags in {conversations_touched} conversations")
+    if st.button("↩️ Discard pending edits", disabled=pending_count == 0):
+        st.session_state.pending_tags = {}
+        st.rerun()
 
 # View mode selector
 st.markdown("---")
@@ -145,8 +198,8 @@ view_mode = st.radio(
 
 filter_common = (view_mode == "Common Messages")
 
-# Collect messages based on filter
-user_messages = collect_user_messages(conversations, filter_common=filter_common)
+# Filter on the saved tags so buffered edits do not reshuffle the pages while annotating
+user_messages = filter_messages(st.session_state.user_messages, filter_common=filter_common)
 
 st.markdown("---")
 st.markdown(f"### Found {len(user_messages)} {view_mode}")
@@ -155,10 +208,43 @@ if len(user_messages) == 0:
     st.warning(f"No {view_mode.lower()} found in this file.")
     st.stop()
 
-# Display messages
-for idx, msg_data in enumerate(user_messages):
+# Pagination
+page_col1, page_col2 = st.columns([1, 1])
+with page_col1:
+    page_size = st.selectbox("Messages per page:", options=PAGE_SIZES, index=1)
+total_pages = (len(user_messages) + page_size - 1) // page_size
+with page_col2:
+    page = st.number_input(f"Page (1 - {total_pages}):", min_value=1, max_value=total_pages, value=1, step=1)
+
+page_start = (page - 1) * page_size
+page_messages = user_messages[page_start:page_start + page_size]
+page_keys = [message_key(m) for m in page_messages]
+
+# Bulk actions on the selected messages
+selected_keys = st.session_state.selected_keys
+bulk_col1, bulk_col2, bulk_col3, bulk_col4 = st.columns(4)
+with bulk_col1:
+    st.button("☑️ Select page", on_click=select_page, args=(page_keys, True))
+with bulk_col2:
+    st.button("⬜ Clear page selection", on_click=select_page, args=(page_keys, False))
+with bulk_col3:
+    st.button(f"Tag {len(selected_keys)} selected Common", on_click=set_tags, args=(list(selected_keys), True), disabled=not selected_keys)
+with bulk_col4:
+    st.button(f"Tag {len(selected_keys)} selected Uncommon", on_click=set_tags, args=(list(selected_keys), False), disabled=not selected_keys)
+
+# Display only the visible page
+for offset, msg_data in enumerate(page_messages):
+    idx = page_start + offset
+    key = message_key(msg_data)
     with st.chat_message("user", avatar="👤"):
-        st.markdown(f"#### Message {idx + 1} / {len(user_messages)}")
+        select_col, title_col = st.columns([1, 11])
+        with select_col:
+            widget_key = select_widget_key(key)
+            if widget_key not in st.session_state:
+                st.session_state[widget_key] = key in selected_keys
+            st.checkbox("Select", key=widget_key, label_visibility="collapsed", on_change=toggle_selected, args=(key,))
+        with title_col:
+            st.markdown(f"#### Message {idx + 1} / {len(user_messages)}")
         
         # Display original message
         st.markdown(f"**📝 Original Message:**")
@@ -180,31 +266,22 @@ for idx, msg_data in enumerate(user_messages):
         # Action buttons
         col1, col2, col3 = st.columns([2, 1, 1])
         
+        is_common = effective_tag(msg_data)
         with col1:
-            current_tag = "Common" if msg_data['is_common'] else "Uncommon"
-            st.markdown(f"**Current Tag:** `{current_tag}`")
+            current_tag = "Common" if is_common else "Uncommon"
+            pending_marker = " (unsaved)" if key in st.session_state.pending_tags else ""
+            st.markdown(f"**Current Tag:** `{current_tag}`{pending_marker}")
         
         with col2:
             # Button to tag as opposite
-            if msg_data['is_common']:
+            if is_common:
                 button_label = "Tag Uncommon"
                 new_value = False
             else:
                 button_label = "Tag Common"
                 new_value = True
             
-            if st.button(button_label, key=f"toggle_{idx}"):
-                # Update the message in the original conversations list
-                conv_idx = msg_data['conv_index']
-                msg_idx = msg_data['msg_index']
-                conversations[conv_idx]['messages'][msg_idx]['is_query_common'] = new_value
-                
-                # Save to file
-                save_conversations(json_path, conversations)
-                st.session_state.conversations = conversations
-                
-                st.success(f"✓ Tagged as {'Common' if new_value else 'Uncommon'}!")
-                st.rerun()
+            st.button(button_label, key=f"toggle_{key[0]}_{key[1]}", on_click=set_tags, args=([key], new_value))
 
 st.markdown("---")
-st.markdown(f"**Total Messages Displayed:** {len(user_messages)}")
+st.markdown(f"**Messages on this page:** {len(page_messages)} of {len(user_messages)}")
@@ -17,7 +17,7 @@ This batch processing design helps minimize token usage and optimize classificat
 """
 
 
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from typing import List, Literal
@@ -25,6 +25,9 @@ import json
 import os
 from dotenv import load_dotenv, find_dotenv
 import time
+from pathlib import Path
+from embedding_cache import get_embedding_cache
+from daily_conversation_analysis.semantic_classifier import FewShotClassifier
 
 env_path = "/Users/ashutosh1/Documents/ATT03251.env"
 
@@ -43,6 +46,14 @@ llm = ChatOpenAI(
 
 structured_llm = llm.with_structured_output(MessageClassifications)
 
+embeddings = OpenAIEmbeddings(
+    model="text-embedding-3-small",
+    dimensions=512,
+    api_key=os.getenv("OPENAI_API_KEY")
+)
+# Shared with process_modified_jsons retrieval, so a text is only ever embedded once
+embed_documents = get_embedding_cache("text-embedding-3-small", 512).wrap(embeddings.embed_documents)
+
 def load_few_shot_examples(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -59,16 +70,33 @@ def build_prompt(messages, few_shot_examples):
     prompt_parts.append("\nReturn classifications in the same order as the input messages.")
     return "\n".join(prompt_parts)
 
-def classify_messages(messages, few_shot_examples=None):
-    if not few_shot_examples:
-        few_shot_examples = load_few_shot_examples(os.path.join(os.path.dirname(os.path.abspath(__file__)), "few_shot_examples", "few_shot_examples.json"))
-    
+FEW_SHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "few_shot_examples")
+EXAMPLE_VECTORS_PATH = Path(FEW_SHOT_DIR) / "few_shot_examples.text-embedding-3-small-512.npz"
+
+def llm_classify_messages(messages, few_shot_examples):
     prompt = build_prompt(messages, few_shot_examples)
     response = structured_llm.invoke(prompt)
     time.sleep(10)
     
     return response.classifications
 
+few_shot_classifier = FewShotClassifier(
+    embed_documents,
+    EXAMPLE_VECTORS_PATH,
+    llm_classify_messages,
+)
+get_preclassifier = few_shot_classifier.get_preclassifier
+report_semantic_savings = few_shot_classifier.report_savings
+
+def classify_messages(messages, few_shot_examples=None, use_semantic_cache=True):
+    """
+    Classify messages as 'common' / 'uncommon', labeling near-duplicates of a few-shot example
+    locally (see FewShotClassifier.classify).
+    """
+    if not few_shot_examples:
+        few_shot_examples = load_few_shot_examples(os.path.join(FEW_SHOT_DIR, "few_shot_examples.json"))
+    return few_shot_classifier.classify(messages, few_shot_examples, use_semantic_cache)
+
 if __name__ == "__main__":
     few_shot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "few_shot_examples", "few_shot_examples.json")
     few_shot_examples = load_few_shot_examples(few_shot_path)
@@ -0,0 +1,70 @@
+"""
+Local semantic clustering of standalone questions.
+
+Questions are embedded in batches, L2-normalised and grouped with a single-pass leader
+clustering on cosine similarity: questions are visited in descending frequency, each one joins
+the most similar existing cluster centroid if the similarity is above the threshold, otherwise it
+starts a new cluster. The first (most frequent) member of every cluster is its representative, so
+only one question per cluster has to be sent to an LLM for naming and categorisation.
+"""
+
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+
+def embed_in_batches(texts: Sequence[str], embed_fn: Callable[[List[str]], Sequence[Sequence[float]]], batch_size: int = 100) -> np.ndarray:
+    """Embed texts with embed_fn, batch_size texts per call. Returns a float32 (n, dim) array."""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embed_fn(list(texts[start:start + batch_size])))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def cluster_by_similarity(vectors: np.ndarray, weights: Sequence[float], threshold: float = 0.85) -> List[List[int]]:
+    """
+    Group rows of vectors into clusters whose members have cosine similarity >= threshold
+    to the cluster centroid.
+
+    Args:
+        vectors: (n, dim) embeddings.
+        weights: Per-row weights (e.g. question counts); heavier rows are visited first and
+            become cluster representatives.
+        threshold: Minimum cosine similarity for joining an existing cluster.
+
+    Returns:
+        List of clusters, each a list of row indices with the representative first.
+        Clusters are ordered by their representative's weight, descending.
+    """
+    n = len(vectors)
+    if n == 0:
+        return []
+    unit = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    order = np.argsort(-np.asarray(weights, dtype=np.float64), kind="stable")
+
+    centroid_sums = np.zeros_like(unit)
+    centroids = np.zeros_like(unit)
+    clusters: List[List[int]] = []
+
+    for idx in order:
+        v = unit[idx]
+        k = len(clusters)
+        if k:
+            sims = centroids[:k] @ v
+            best = int(np.argmax(sims))
+            if sims[best] >= threshold:
+                clusters[best].append(int(idx))
+                centroid_sums[best] += v
+                centroids[best] = centroid_sums[best] / np.linalg.norm(centroid_sums[best])
+                continue
+        clusters.append([int(idx)])
+        centroid_sums[k] = v
+        centroids[k] = v
+
+    return clusters
@@ -0,0 +1,371 @@
+"""
+Nearest-neighbour pre-classification of user messages against the labeled few-shot examples.
+
+Most "common" messages are near-duplicates of an entry in few_shot_examples.json. Before a batch
+is sent to an LLM, every message is embedded and compared with an index of the labeled
+examples; messages whose nearest neighbours are above a similarity threshold and agree on a
+label are labeled locally, and only the ambiguous remainder goes to the LLM.
+
+The same index also selects, per batch, the k most similar common and uncommon examples to
+put in the classification prompt (select_few_shot_examples), instead of every example.
+
+Example vectors are stored next to the examples file (one .npz per embedding model) and only
+examples that are not in it yet are embedded, so the index is cheap to rebuild when
+build_few_shot_examples adds rows.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from daily_conversation_analysis.question_clustering import embed_in_batches, normalize_rows
+
+
+SEMANTIC_LABEL_THRESHOLD = float(os.getenv("SEMANTIC_LABEL_THRESHOLD", "0.92"))
+FEW_SHOT_K_PER_LABEL = int(os.getenv("FEW_SHOT_K_PER_LABEL", "20"))
+FEW_SHOT_MAX_TOKENS = int(os.getenv("FEW_SHOT_MAX_TOKENS", "3000"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate; Indic scripts tokenize to more tokens per character than English."""
+    return len(text) // 3 + 1
+
+
+def examples_fingerprint(few_shot_examples: Sequence[Dict]) -> str:
+    digest = hashlib.sha256()
+    for ex in few_shot_examples:
+        digest.update(f"{ex['input']}\x1f{ex['output']}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExampleIndex:
+    """
+    Vector index over few-shot examples.
+
+    Args:
+        few_shot_examples: List of {"input": str, "output": "common" | "uncommon", ...}.
+        embed_fn: Function embedding a list of texts.
+        vectors_path: Optional .npz file persisting example vectors between runs.
+        batch_size: Texts per embed_fn call.
+    """
+
+    def __init__(
+        self,
+        few_shot_examples: Sequence[Dict],
+        embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        vectors_path: Optional[Path] = None,
+        batch_size: int = 100,
+    ):
+        self.examples = list(few_shot_examples)
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        self.vectors_path = Path(vectors_path) if vectors_path else None
+        self.fingerprint = examples_fingerprint(self.examples)
+        self.labels = np.array([ex["output"] for ex in self.examples])
+        self.vectors = self._build_vectors()
+        self._query_vectors: Dict[str, np.ndarray] = {}
+
+    def _load_stored(self) -> Dict[str, np.ndarray]:
+        if not self.vectors_path or not self.vectors_path.exists():
+            return {}
+        try:
+            stored = np.load(self.vectors_path, allow_pickle=False)
+            return dict(zip(stored["texts"].tolist(), stored["vectors"]))
+        except Exception as e:
+            print(f"Could not read example vectors from {self.vectors_path}: {e}")
+            return {}
+
+    def _build_vectors(self) -> np.ndarray:
+        texts = [ex["input"] for ex in self.examples]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        stored = self._load_stored()
+        missing = sorted({t for t in texts if t not in stored})
+        if missing:
+            print(f"Embedding {len(missing)} new few-shot examples...")
+            new_vectors = normalize_rows(embed_in_batches(missing, self.embed_fn, self.batch_size))
+            stored.update(zip(missing, new_vectors))
+            if self.vectors_path:
+                self._save(stored)
+
+        return np.stack([stored[t] for t in texts]).astype(np.float32)
+
+    def _save(self, stored: Dict[str, np.ndarray]) -> None:
+        self.vectors_path.parent.mkdir(parents=True, exist_ok=True)
+        texts = list(stored)
+        # Unique tmp file: parallel day workers may build the same index at the same time
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.vectors_path.parent), prefix=f".{self.vectors_path.name}.", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, texts=np.array(texts), vectors=np.stack([stored[t] for t in texts]))
+            os.replace(tmp_path, self.vectors_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed query texts, reusing vectors of texts embedded earlier in this run."""
+        missing = list(dict.fromkeys(t for t in texts if t not in self._query_vectors))
+        if missing:
+            if len(self._query_vectors) > 10000:
+                self._query_vectors.clear()
+            vectors = normalize_rows(embed_in_batches(missing, self.embed_fn, self.batch_size))
+            self._query_vectors.update(zip(missing, vectors))
+        return np.stack([self._query_vectors[t] for t in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+    def search(self, query_vectors: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, indices), each (n_queries, k), sorted by cosine similarity descending."""
+        if len(self.vectors) == 0 or len(query_vectors) == 0:
+            empty = np.zeros((len(query_vectors), 0))
+            return empty, empty.astype(int)
+        k = min(k, len(self.vectors))
+        scores = query_vectors @ self.vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+class SemanticPreclassifier:
+    """
+    Labels messages locally when their nearest labeled examples are similar enough.
+
+    A message is auto-labeled when its best match has similarity >= threshold and every
+    neighbour among the top k that is also above the threshold carries the same label.
+    Counters track how many messages and LLM calls were saved; they are updated through
+    record_batch once a batch is fully labeled, so a batch that is split and retried is not
+    counted twice.
+    """
+
+    def __init__(self, index: ExampleIndex, threshold: float = 0.92, k: int = 5):
+        self.index = index
+        self.threshold = threshold
+        self.k = k
+        self.messages_seen = 0
+        self.messages_auto_labeled = 0
+        self.llm_calls_made = 0
+        self.llm_calls_saved = 0
+
+    def preclassify(self, messages: Sequence[str]) -> List[Optional[str]]:
+        """Return a label per message, or None where the LLM still has to decide."""
+        labels: List[Optional[str]] = [None] * len(messages)
+        if not messages or len(self.index.vectors) == 0:
+            return labels
+
+        scores, neighbours = self.index.search(self.index.embed(messages), self.k)
+        for i in range(len(messages)):
+            if scores.shape[1] == 0 or scores[i, 0] < self.threshold:
+                continue
+            close = set(self.index.labels[neighbours[i][scores[i] >= self.threshold]].tolist())
+            if len(close) == 1:
+                labels[i] = close.pop()
+        return labels
+
+    def record_batch(self, n_messages: int, n_auto_labeled: int) -> None:
+        """Count a labeled batch; the LLM call counts as saved when every message was labeled locally."""
+        self.messages_seen += n_messages
+        self.messages_auto_labeled += n_auto_labeled
+        if n_auto_labeled < n_messages:
+            self.llm_calls_made += 1
+        else:
+            self.llm_calls_saved += 1
+
+    def report(self) -> str:
+        return (
+            f"Semantic pre-classification: {self.messages_auto_labeled}/{self.messages_seen} messages "
+            f"auto-labeled, {self.llm_calls_saved} LLM calls saved, {self.llm_calls_made} LLM calls made"
+        )
+
+
+def refresh_preclassifier(
+    preclassifier: Optional[SemanticPreclassifier],
+    few_shot_examples: Sequence[Dict],
+    embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+    vectors_path: Path,
+    threshold: float,
+) -> Optional[SemanticPreclassifier]:
+    """
+    Return a pre-classifier whose index matches few_shot_examples, creating it on first use and
+    rebuilding only the index (keeping the savings counters) when the examples change.
+    Returns the previous pre-classifier (possibly None) if the index cannot be built.
+    """
+    if preclassifier is not None and preclassifier.index.fingerprint == examples_fingerprint(few_shot_examples):
+        return preclassifier
+    try:
+        index = ExampleIndex(few_shot_examples, embed_fn, vectors_path=vectors_path)
+    except Exception as e:
+        print(f"Could not build few-shot example index: {e}")
+        return preclassifier
+    if preclassifier is None:
+        return SemanticPreclassifier(index, threshold=threshold)
+    preclassifier.index = index
+    return preclassifier
+
+
+def select_few_shot_examples(
+    index: ExampleIndex,
+    messages: Sequence[str],
+    k_per_label: int = 20,
+    max_tokens: int = 3000,
+) -> List[Dict]:
+    """
+    Pick the few-shot examples most relevant to a batch of messages.
+
+    Examples are taken rank by rank across all messages (each message's nearest example first,
+    then second nearest, ...) alternating between labels, until every label has k_per_label
+    examples or the estimated token budget is used up.
+    """
+    if not messages or len(index.vectors) == 0:
+        return []
+    scores = index.embed(messages) @ index.vectors.T
+
+    rankings = {}
+    for label in sorted(set(index.labels.tolist())):
+        columns = np.flatnonzero(index.labels == label)
+        order = np.argsort(-scores[:, columns], axis=1)
+        rankings[label] = columns[order]
+
+    selected: List[int] = []
+    seen = set()
+    counts = {label: 0 for label in rankings}
+    tokens = 0
+    max_rank = max(r.shape[1] for r in rankings.values())
+    for rank in range(max_rank):
+        for row in range(len(messages)):
+            for label, ranked in rankings.items():
+                if counts[label] >= k_per_label or rank >= ranked.shape[1]:
+                    continue
+                idx = int(ranked[row, rank])
+                if idx in seen:
+                    continue
+                ex = index.examples[idx]
+                cost = estimate_tokens(ex["input"]) + 4
+                if tokens + cost > max_tokens:
+                    return [index.examples[i] for i in selected]
+                seen.add(idx)
+                selected.append(idx)
+                counts[label] += 1
+                tokens += cost
+        if all(count >= k_per_label for count in counts.values()):
+            break
+    return [index.examples[i] for i in selected]
+
+
+class ClassificationLengthError(ValueError):
+    """The LLM returned a different number of labels than it was given messages."""
+
+    def __init__(self, expected: int, got: int):
+        super().__init__(f"Expected {expected} classifications, got {got}")
+        self.expected = expected
+        self.got = got
+
+
+def classify_with_preclassifier(
+    messages: Sequence[str],
+    preclassifier: Optional[SemanticPreclassifier],
+    llm_classify: Callable[[List[str]], List[str]],
+) -> List[str]:
+    """
+    Pre-label messages locally and send only the ambiguous remainder to llm_classify.
+
+    Raises:
+        ClassificationLengthError: llm_classify returned a list of the wrong length, so its
+            labels cannot be matched to the messages; the caller should split the batch and retry.
+    """
+    if preclassifier is None:
+        llm_labels = list(llm_classify(list(messages)))
+        if len(llm_labels) != len(messages):
+            raise ClassificationLengthError(len(messages), len(llm_labels))
+        return llm_labels
+
+    try:
+        labels = preclassifier.preclassify(messages)
+    except Exception as e:
+        print(f"Semantic pre-classification failed, falling back to LLM: {e}")
+        labels = [None] * len(messages)
+
+    pending = [i for i, label in enumerate(labels) if label is None]
+    if pending:
+        llm_labels = list(llm_classify([messages[i] for i in pending]))
+        if len(llm_labels) != len(pending):
+            # The messages are not counted yet: the caller retries them in smaller batches
+            preclassifier.llm_calls_made += 1
+            raise ClassificationLengthError(len(pending), len(llm_labels))
+        for i, label in zip(pending, llm_labels):
+            labels[i] = label
+    preclassifier.record_batch(len(messages), len(messages) - len(pending))
+    return labels
+
+
+class FewShotClassifier:
+    """
+    Pre-classification and per-batch few-shot selection around one LLM classifier.
+
+    Args:
+        embed_fn: Function embedding a list of texts.
+        vectors_path: .npz file persisting the example vectors of this embedding model.
+        llm_classify: Function (messages, few_shot_examples) -> labels, called with the examples
+            already selected for the messages.
+        threshold: Similarity above which a message is labeled locally.
+        k_per_label: Few-shot examples per label put in a prompt.
+        max_tokens: Estimated token budget of those examples.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        vectors_path: Path,
+        llm_classify: Callable[[List[str], List[Dict]], List[str]],
+        threshold: float = SEMANTIC_LABEL_THRESHOLD,
+        k_per_label: int = FEW_SHOT_K_PER_LABEL,
+        max_tokens: int = FEW_SHOT_MAX_TOKENS,
+    ):
+        self.embed_fn = embed_fn
+        self.vectors_path = Path(vectors_path)
+        self.llm_classify = llm_classify
+        self.threshold = threshold
+        self.k_per_label = k_per_label
+        self.max_tokens = max_tokens
+        self.preclassifier: Optional[SemanticPreclassifier] = None
+
+    def get_preclassifier(self, few_shot_examples: Sequence[Dict]) -> Optional[SemanticPreclassifier]:
+        self.preclassifier = refresh_preclassifier(
+            self.preclassifier, few_shot_examples, self.embed_fn, self.vectors_path, self.threshold
+        )
+        return self.preclassifier
+
+    def report_savings(self) -> None:
+        if self.preclassifier is not None:
+            print(self.preclassifier.report())
+
+    def select_examples(self, messages: Sequence[str], few_shot_examples: List[Dict]) -> List[Dict]:
+        """k-NN selection of few-shot examples for this batch; falls back to all examples without an index."""
+        if self.preclassifier is None:
+            return few_shot_examples
+        try:
+            selected = select_few_shot_examples(
+                self.preclassifier.index, messages, k_per_label=self.k_per_label, max_tokens=self.max_tokens
+            )
+        except Exception as e:
+            print(f"Few-shot selection failed, using all examples: {e}")
+            return few_shot_examples
+        return selected or few_shot_examples
+
+    def classify(self, messages: Sequence[str], few_shot_examples: List[Dict], use_semantic_cache: bool = True) -> List[str]:
+        """
+        Classify messages as 'common' / 'uncommon'. Messages that are near-duplicates of a labeled
+        few-shot example are labeled locally; only the rest are sent to the LLM, and the LLM call
+        is skipped entirely when nothing is left.
+        """
+        preclassifier = self.get_preclassifier(few_shot_examples) if use_semantic_cache else None
+        return classify_with_preclassifier(
+            messages,
+            preclassifier,
+            lambda pending: self.llm_classify(pending, self.select_examples(pending, few_shot_examples)),
+        )
@@ -1,3 +1,4 @@
 from .append_to_standalone import process_and_append_message
+from .example_store import StandaloneExampleStore
 
-__all__ = ['process_and_append_message']
+__all__ = ['process_and_append_message', 'StandaloneExampleStore']
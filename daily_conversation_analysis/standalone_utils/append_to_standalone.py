@@ -1,35 +1,17 @@
-import json
 import os
+import sqlite3
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Sequence
 
+from .example_store import StandaloneExampleStore, escape_braces
 
-def check_if_similar_example_exists(user_input: str, existing_examples: str) -> bool:
-    """
-    Check if a similar example already exists in the few-shot examples.
-    
-    Args:
-        user_input: The user input to check
-        existing_examples: The existing few-shot examples string
-        
-    Returns:
-        True if a similar example exists, False otherwise
-    """
-    # Split the examples by the separator
-    examples = existing_examples.split("----------------------------------------")
-    
-    # Extract all "Follow Up Input:" entries
-    for example in examples:
-        if "Follow Up Input:" in example:
-            lines = example.split("\n")
-            for line in lines:
-                if line.strip().startswith("Follow Up Input:"):
-                    existing_input = line.replace("Follow Up Input:", "").strip()
-                    # Simple exact match for now (can be enhanced with similarity)
-                    if existing_input == user_input:
-                        return True
-    
-    return False
+# Path to standalone_query_examples.py
+STANDALONE_FILE_PATH = (Path(__file__).parent.parent.parent.parent / "new_pull" / "fyllo-ai" / "bot_core" / "standalone_query_examples.py").resolve()
+EXAMPLES_DB_PATH = Path(os.getenv("STANDALONE_EXAMPLES_DB", str(Path(__file__).parent / "standalone_examples.sqlite3")))
+# Cosine similarity above which a new input counts as a near-duplicate (only used with an embed_fn)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("STANDALONE_NEAR_DUPLICATE_THRESHOLD", "0.95"))
+
+_example_store: Optional[StandaloneExampleStore] = None
 
 
 def format_example(
@@ -85,78 +67,31 @@ def format_example(
     return "\n".join(example_lines)
 
 
-def get_next_example_number(existing_examples: str) -> int:
-    """
-    Determine the next example number by counting existing examples.
-    
-    Args:
-        existing_examples: The existing few-shot examples string
-        
-    Returns:
-        The next example number to use
-    """
-    import re
-    # Find all "Example N:" patterns
-    example_numbers = re.findall(r'Example (\d+):', existing_examples)
-    if example_numbers:
-        # Return the max number + 1
-        return max(int(num) for num in example_numbers) + 1
-    else:
-        return 1
-
-
-def append_to_standalone_file(example_text: str, file_path: str) -> None:
-    """
-    Append the formatted example to the standalone_query_examples.py file.
-    
-    Args:
-        example_text: The formatted example text to append
-        file_path: Path to the standalone_query_examples.py file
-    """
-    # Read the current file content
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Find the end of the few_shot_rephrase_examples string
-    # It ends with "----------------------------------------\"\"\".strip()"
-    
-    # We need to insert the new example before the final closing
-    # Find the pattern: ----------------------------------------""".strip()
-    end_pattern = '----------------------------------------""".strip()'
-    
-    if end_pattern in content:
-        # Split at the end pattern
-        before_end = content.rsplit(end_pattern, 1)[0]
-        
-        # Remove all trailing separators and whitespace
-        separator = "----------------------------------------"
-        before_end = before_end.rstrip()
-        while before_end.endswith(separator):
-            before_end = before_end[:-len(separator)].rstrip()
-        
-        # Add the new example with proper formatting
-        # Format: [existing content]\n[separator]\n[new example]\n[end_pattern]
-        new_content = before_end + '\n' + separator + '\n' + example_text + '\n' + end_pattern
-        
-        # Write back to file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
-    else:
-        raise ValueError(f"Could not find the end pattern in {file_path}")
+def get_example_store() -> StandaloneExampleStore:
+    """The example store, created on first use and synced with the module if it was edited by hand."""
+    global _example_store
+    if _example_store is None:
+        _example_store = StandaloneExampleStore(EXAMPLES_DB_PATH, STANDALONE_FILE_PATH)
+    _example_store.sync_from_module()
+    return _example_store
 
 
 def process_and_append_message(
     conversation: Dict[str, Any], 
     message_index: int, 
-    json_file_path: str
+    embed_fn: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None
 ) -> Dict[str, Any]:
     """
     Main function to process a message and append it to standalone examples.
     
+    The message is marked with added_to_standalone_examples in `conversation`; persisting
+    the conversation is left to the caller (e.g. ConversationStore.update in the viewer).
+    
     Args:
         conversation: The full conversation object
         message_index: Index of the user message to process
-        json_file_path: Path to the conversations JSON file
+        embed_fn: Optional function embedding a list of texts; when given, inputs that are
+            near-duplicates of an existing example are rejected as well
         
     Returns:
         Dictionary with 'status' (success/error) and 'message'
@@ -217,64 +152,42 @@ def process_and_append_message(
             if content:
                 chat_history.append({'role': role, 'content': content})
         
-        # Path to standalone_query_examples.py
-        standalone_file_path = Path(__file__).parent.parent.parent.parent / "new_pull" / "fyllo-ai" / "bot_core" / "standalone_query_examples.py"
-        standalone_file_path = str(standalone_file_path.resolve())
-        
-        # Read existing examples
-        with open(standalone_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Extract the few_shot_rephrase_examples string
-        # Find the content between the triple quotes
-        start_marker = 'few_shot_rephrase_examples = f"""'
-        end_marker = '""".strip()'
+        store = get_example_store()
         
-        if start_marker in content and end_marker in content:
-            start_idx = content.index(start_marker) + len(start_marker)
-            end_idx = content.rindex(end_marker)
-            existing_examples = content[start_idx:end_idx]
-        else:
+        # Exact duplicate check (normalized input, index lookup)
+        if store.exists(user_input):
             return {
                 'status': 'error',
-                'message': 'Could not parse existing examples from standalone file'
+                'message': 'A similar example with this user input already exists in standalone examples'
             }
         
-        # Check if similar example exists
-        if check_if_similar_example_exists(user_input, existing_examples):
+        # Optional near-duplicate check by embedding similarity
+        query_vector = None
+        if embed_fn is not None:
+            match, query_vector = store.find_near_duplicate(user_input, embed_fn, NEAR_DUPLICATE_THRESHOLD)
+            if match:
+                return {
+                    'status': 'error',
+                    'message': f"A similar example already exists in standalone examples: \"{match['follow_up_input']}\" (similarity {match['similarity']:.2f})"
+                }
+        
+        # Format the new example and add it to the store
+        next_example_num = store.next_number()
+        example_text = escape_braces(format_example(chat_history, user_input, wrong_standalone, correct_translation, next_example_num))
+        try:
+            store.add(user_input, example_text, next_example_num, embedding=query_vector)
+        except sqlite3.IntegrityError:
             return {
                 'status': 'error',
                 'message': 'A similar example with this user input already exists in standalone examples'
             }
         
-        # Get the next example number
-        next_example_num = get_next_example_number(existing_examples)
-        
-        # Format the new example
-        example_text = format_example(chat_history, user_input, wrong_standalone, correct_translation, next_example_num)
-        
-        # Append to standalone file
-        append_to_standalone_file(example_text, standalone_file_path)
+        # Re-render standalone_query_examples.py from the store
+        store.render_module()
         
         # Mark the message as added in the conversation
         user_msg['added_to_standalone_examples'] = True
         
-        # Save the updated conversation JSON
-        # Read all conversations
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            all_conversations = json.load(f)
-        
-        # Find and update the conversation
-        conv_id = conversation.get('_id')
-        for i, conv in enumerate(all_conversations):
-            if conv.get('_id') == conv_id:
-                all_conversations[i] = conversation
-                break
-        
-        # Save back to file
-        with open(json_file_path, 'w', encoding='utf-8') as f:
-            json.dump(all_conversations, f, ensure_ascii=False, indent=2)
-        
         return {
             'status': 'success',
             'message': f'Successfully added example to standalone file and marked message as added!'
@@ -0,0 +1,313 @@
+"""
+Structured store for the standalone-question few-shot examples.
+
+The examples used to live only as text inside bot_core/standalone_query_examples.py, so every
+"Add to Standalone" click re-read the module, scanned it line by line for duplicates, regex-scanned
+it again for the next example number and rewrote it. They are now kept in SQLite with a unique
+index on the normalized "Follow Up Input", so duplicate checks are a single index lookup and
+example numbers come from the table.
+
+The Python module is treated as a rendered artifact: it is regenerated (only the
+few_shot_rephrase_examples string, the rest of the module is kept) when the store has examples
+the module does not. If the module was edited by hand since it was last rendered, its examples
+are merged into the store first, so nothing written there is lost.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SEPARATOR = "----------------------------------------"
+START_MARKER = 'few_shot_rephrase_examples = f"""'
+END_MARKER = '""".strip()'
+FOLLOW_UP_PREFIX = "Follow Up Input:"
+
+
+def normalize_input(text: str) -> str:
+    """Case- and whitespace-insensitive form of a follow-up input."""
+    return " ".join(text.split()).casefold()
+
+
+def input_key(text: str) -> str:
+    return hashlib.sha256(normalize_input(text).encode("utf-8")).hexdigest()
+
+
+def escape_braces(text: str) -> str:
+    """The examples live inside an f-string, so literal braces must be doubled."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def unescape_braces(text: str) -> str:
+    return text.replace("{{", "{").replace("}}", "}")
+
+
+def split_examples(section: str) -> List[str]:
+    """Split the few_shot_rephrase_examples string into example blocks (blocks without a follow-up input are kept as-is)."""
+    return [block.strip("\n") for block in section.split(SEPARATOR) if block.strip()]
+
+
+def follow_up_input(block: str) -> Optional[str]:
+    for line in block.split("\n"):
+        if line.strip().startswith(FOLLOW_UP_PREFIX):
+            return line.strip()[len(FOLLOW_UP_PREFIX):].strip()
+    return None
+
+
+class StandaloneExampleStore:
+    """
+    Args:
+        db_path: SQLite file holding the examples.
+        module_path: The generated standalone_query_examples.py.
+    """
+
+    def __init__(self, db_path, module_path):
+        self.db_path = Path(db_path)
+        self.module_path = Path(module_path)
+        self._lock = threading.Lock()
+        self._vectors = None
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS examples ("
+            "number INTEGER PRIMARY KEY, input_key TEXT UNIQUE, text TEXT NOT NULL, "
+            "follow_up_input TEXT, created_at REAL NOT NULL, embedding BLOB)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if self._get_meta("raw_input_keys") is None:
+            # Examples imported by older versions were keyed on the brace-escaped module text
+            rows = self._conn.execute(
+                "SELECT number, follow_up_input FROM examples WHERE follow_up_input LIKE '%{{%' OR follow_up_input LIKE '%}}%'"
+            ).fetchall()
+            for number, text in rows:
+                raw = unescape_braces(text)
+                self._conn.execute(
+                    "UPDATE OR IGNORE examples SET input_key = ?, follow_up_input = ? WHERE number = ?",
+                    (input_key(raw), raw, number),
+                )
+            self._set_meta("raw_input_keys", "1")
+        self._conn.commit()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _revision(self) -> int:
+        return int(self._get_meta("revision") or 0)
+
+    def _bump_revision(self) -> None:
+        self._set_meta("revision", str(self._revision() + 1))
+
+    # --- module sync -------------------------------------------------------------------------
+
+    def _read_module(self):
+        content = self.module_path.read_text(encoding="utf-8")
+        if START_MARKER not in content or END_MARKER not in content:
+            raise ValueError(f"Could not parse existing examples from {self.module_path}")
+        start = content.index(START_MARKER) + len(START_MARKER)
+        end = content.rindex(END_MARKER)
+        return content, start, end
+
+    def _module_stamp(self) -> str:
+        stat = self.module_path.stat()
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def sync_from_module(self) -> int:
+        """
+        Import examples from the module if it changed since it was last rendered or imported.
+        Returns the number of examples added to the store.
+        """
+        if not self.module_path.exists() or self._get_meta("module_stamp") == self._module_stamp():
+            return 0
+        content, start, end = self._read_module()
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+        added = 0
+        with self._lock:
+            if digest != self._get_meta("module_digest"):
+                was_stale = self.is_stale()
+                preamble = []
+                epilogue = []
+                seen_example = False
+                renumbered = 0
+                for block in split_examples(content[start:end]):
+                    user_input = follow_up_input(block)
+                    if user_input is not None:
+                        # Keyed on the raw input, like add() and exists()
+                        user_input = unescape_braces(user_input)
+                    if user_input is None:
+                        # Free text is kept verbatim: before the first example as the preamble,
+                        # anything after it (notes, closing instructions) as the epilogue
+                        (epilogue if seen_example else preamble).append(block)
+                        continue
+                    seen_example = True
+                    if self._conn.execute(
+                        "SELECT 1 FROM examples WHERE input_key = ?", (input_key(user_input),)
+                    ).fetchone():
+                        continue
+                    match = re.match(r"\s*Example (\d+):", block)
+                    number = int(match.group(1)) if match else None
+                    if number is not None and self._conn.execute(
+                        "SELECT 1 FROM examples WHERE number = ?", (number,)
+                    ).fetchone():
+                        # A different example already has this number (e.g. added from the UI while
+                        # the module was edited by hand); keep both by giving this one the next number
+                        new_number = (self._conn.execute("SELECT MAX(number) FROM examples").fetchone()[0] or 0) + 1
+                        block = re.sub(r"Example \d+:", f"Example {new_number}:", block, count=1)
+                        number = new_number
+                        renumbered += 1
+                    self._conn.execute(
+                        "INSERT INTO examples (number, input_key, text, follow_up_input, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (number, input_key(user_input), block, user_input, time.time()),
+                    )
+                    added += 1
+                if renumbered:
+                    print(f"Renumbered {renumbered} examples from {self.module_path} whose numbers were already taken")
+                    # The module still has the old numbers, so it must be re-rendered
+                    self._bump_revision()
+                self._set_meta("epilogue", json.dumps(epilogue))
+                self._set_meta("preamble", json.dumps(preamble))
+                if added:
+                    self._vectors = None
+                self._set_meta("module_digest", digest)
+                if not was_stale and not renumbered:
+                    # The module already contains everything that was imported from it
+                    self._set_meta("rendered_revision", str(self._revision()))
+            self._set_meta("module_stamp", self._module_stamp())
+            self._conn.commit()
+        if added:
+            print(f"Imported {added} examples from {self.module_path}")
+        return added
+
+    def is_stale(self) -> bool:
+        return int(self._get_meta("rendered_revision") or 0) < self._revision()
+
+    def render_module(self, force: bool = False) -> bool:
+        """Rewrite the examples string in the module if the store has changed since the last render. Returns True if written."""
+        if not (force or self.is_stale()):
+            return False
+        content, start, end = self._read_module()
+        with self._lock:
+            preamble = json.loads(self._get_meta("preamble") or "[]")
+            epilogue = json.loads(self._get_meta("epilogue") or "[]")
+            texts = [row[0] for row in self._conn.execute("SELECT text FROM examples ORDER BY number")]
+            revision = self._revision()
+        section = "\n" + f"\n{SEPARATOR}\n".join(preamble + texts + epilogue) + f"\n{SEPARATOR}"
+        new_content = content[:start] + section + content[end:]
+
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.module_path.parent), prefix=f".{self.module_path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(new_content)
+            os.replace(tmp_path, self.module_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._set_meta("rendered_revision", str(revision))
+            self._set_meta("module_digest", hashlib.sha256(new_content.encode("utf-8")).hexdigest())
+            self._set_meta("module_stamp", self._module_stamp())
+            self._conn.commit()
+        return True
+
+    # --- examples ----------------------------------------------------------------------------
+
+    def exists(self, user_input: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM examples WHERE input_key = ?", (input_key(user_input),)
+            ).fetchone() is not None
+
+    def next_number(self) -> int:
+        with self._lock:
+            return (self._conn.execute("SELECT MAX(number) FROM examples").fetchone()[0] or 0) + 1
+
+    def add(self, user_input: str, text: str, number: int, embedding: Optional[np.ndarray] = None) -> None:
+        """Insert a formatted example. Raises sqlite3.IntegrityError on a duplicate input or number."""
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO examples (number, input_key, text, follow_up_input, created_at, embedding) VALUES (?, ?, ?, ?, ?, ?)",
+                (number, input_key(user_input), text, user_input, time.time(), blob),
+            )
+            self._bump_revision()
+            self._conn.commit()
+            self._vectors = None
+
+    def _example_vectors(self, embed_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> np.ndarray:
+        """Unit vectors of all follow-up inputs, embedding (and storing) only those without one."""
+        if self._vectors is not None:
+            return self._vectors
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT number, follow_up_input, embedding FROM examples WHERE follow_up_input IS NOT NULL ORDER BY number"
+            ).fetchall()
+        missing = [(number, text) for number, text, blob in rows if blob is None]
+        if missing:
+            vectors = np.asarray(embed_fn([text for _, text in missing]), dtype=np.float32)
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE examples SET embedding = ? WHERE number = ?",
+                    [(vector.tobytes(), number) for (number, _), vector in zip(missing, vectors)],
+                )
+                self._conn.commit()
+            filled = dict(zip([number for number, _ in missing], vectors))
+        else:
+            filled = {}
+        matrix = [filled[number] if blob is None else np.frombuffer(blob, dtype=np.float32) for number, _, blob in rows]
+        if not matrix:
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            return self._vectors
+        vectors = np.stack(matrix)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._vectors = vectors / norms
+        return self._vectors
+
+    def find_near_duplicate(
+        self,
+        user_input: str,
+        embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        threshold: float = 0.95,
+    ) -> Tuple[Optional[Dict], np.ndarray]:
+        """
+        Find the most similar existing example by embedding similarity.
+
+        Returns:
+            ({"follow_up_input": str, "similarity": float} or None if nothing reaches threshold,
+            the query vector), so callers can store the vector with the new example.
+        """
+        query = np.asarray(embed_fn([user_input])[0], dtype=np.float32)
+        vectors = self._example_vectors(embed_fn)
+        if len(vectors) and vectors.shape[1] != query.shape[0]:
+            # Stored vectors come from a different embedding model; re-embed everything
+            with self._lock:
+                self._conn.execute("UPDATE examples SET embedding = NULL")
+                self._conn.commit()
+                self._vectors = None
+            vectors = self._example_vectors(embed_fn)
+        if len(vectors) == 0:
+            return None, query
+
+        scores = vectors @ (query / (np.linalg.norm(query) or 1.0))
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None, query
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT follow_up_input FROM examples WHERE follow_up_input IS NOT NULL ORDER BY number"
+            ).fetchall()
+        return {"follow_up_input": rows[best][0], "similarity": float(scores[best])}, query
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".cache" / "embeddings"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of text embeddings for one (model, dimensions) pair.
+
+    Vectors are stored as raw float32 rows in `vectors.f32` and read through a memory map;
+    a SQLite table maps sha256(normalized text) to a row number. New rows are allocated inside
+    a SQLite write transaction and written before it commits, so several processes (e.g. a
+    backfill's day workers) can share one cache safely.
+
+    Args:
+        model: Embedding model name. Include anything else that changes the vectors (e.g. a
+            task type) so different settings never share entries.
+        dims: Vector dimensions; inferred from the first stored vector when None.
+        cache_dir: Root directory; each model gets its own sub-directory.
+    """
+
+    def __init__(self, model: str, dims: Optional[int] = None, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.model = model
+        self.dims = dims
+        self.hits = 0
+        self.misses = 0
+        slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in model)
+        self.dir = Path(cache_dir) / f"{slug}-{dims or 'auto'}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.vectors_path.touch(exist_ok=True)
+        self._lock = threading.Lock()
+        self._mmap: Optional[np.memmap] = None
+        self._conn = sqlite3.connect(str(self.dir / "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        stored_dims = self._get_meta("dims")
+        if stored_dims is not None:
+            if self.dims is not None and int(stored_dims) != self.dims:
+                raise ValueError(f"{self.dir} holds {stored_dims}-dimensional vectors, not {self.dims}")
+            self.dims = int(stored_dims)
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _load_dims(self) -> None:
+        """Pick up the dimensions when another process stored the first vectors after we opened the cache."""
+        if self.dims is None:
+            stored_dims = self._get_meta("dims")
+            if stored_dims is not None:
+                self.dims = int(stored_dims)
+
+    def _rows(self, max_row: int) -> np.memmap:
+        """Memory map covering at least max_row + 1 rows, remapped when the file has grown."""
+        self._load_dims()
+        if self._mmap is None or self._mmap.shape[0] <= max_row:
+            n_rows = self.vectors_path.stat().st_size // (4 * self.dims)
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dims))
+        return self._mmap
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors aligned with texts; None for misses."""
+        keys = [self.make_key(t) for t in texts]
+        rows: Dict[str, int] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows.update(self._conn.execute(f"SELECT key, row FROM keys WHERE key IN ({placeholders})", chunk))
+            if rows:
+                vectors = self._rows(max(rows.values()))
+                found = {key: np.array(vectors[row]) for key, row in rows.items()}
+            else:
+                found = {}
+        result = [found.get(key) for key in keys]
+        hits = sum(v is not None for v in result)
+        self.hits += hits
+        self.misses += len(result) - hits
+        return result
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock:
+            self._load_dims()
+            if self.dims is None:
+                self.dims = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dims:
+                raise ValueError(f"Expected {self.dims}-dimensional vectors, got {vectors.shape[1]}")
+            new = {}
+            for text, vector in zip(texts, vectors):
+                new.setdefault(self.make_key(text), vector)
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('dims', ?)", (str(self.dims),))
+                placeholders = ",".join("?" * len(new))
+                existing = {k for (k,) in self._conn.execute(f"SELECT key FROM keys WHERE key IN ({placeholders})", list(new))}
+                pending = [(k, v) for k, v in new.items() if k not in existing]
+                next_row = int(self._get_meta("rows") or 0)
+                if pending:
+                    block = np.stack([v for _, v in pending]).astype(np.float32)
+                    with open(self.vectors_path, "r+b") as f:
+                        f.seek(next_row * 4 * self.dims)
+                        f.write(block.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._conn.executemany(
+                        "INSERT INTO keys VALUES (?, ?)",
+                        [(k, next_row + i) for i, (k, _) in enumerate(pending)],
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('rows', ?)", (str(next_row + len(pending)),)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def embed(self, texts: Sequence[str], embed_fn: Callable[[List[str]], Sequence[Sequence[float]]], batch_size: int = 100) -> np.ndarray:
+        """Embed texts, calling embed_fn (batch_size texts per call) only for texts not in the cache."""
+        if len(texts) == 0:
+            return np.zeros((0, self.dims or 0), dtype=np.float32)
+        cached = self.get_many(texts)
+        # Deduplicated on the cache key, but embed_fn always gets the original text: normalizing
+        # only decides which texts share an entry, it must not change what is embedded
+        missing: Dict[str, str] = {}
+        for t, v in zip(texts, cached):
+            if v is None:
+                missing.setdefault(self.make_key(t), t)
+        if missing:
+            originals = list(missing.values())
+            computed = []
+            for start in range(0, len(originals), batch_size):
+                computed.extend(embed_fn(originals[start:start + batch_size]))
+            self.put_many(originals, computed)
+            by_key = dict(zip(missing, np.asarray(computed, dtype=np.float32)))
+            cached = [v if v is not None else by_key[self.make_key(t)] for t, v in zip(texts, cached)]
+        return np.stack(cached).astype(np.float32)
+
+    def wrap(self, embed_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> Callable[[List[str]], np.ndarray]:
+        """Drop-in replacement for embed_fn that goes through the cache."""
+        return lambda texts: self.embed(list(texts), embed_fn, batch_size=max(1, len(texts)))
+
+    def print_stats(self) -> None:
+        print(f"Embedding cache [{self.model}]: {self.hits} hits, {self.misses} misses")
+
+
+_caches: Dict[tuple, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str, dims: Optional[int] = None) -> EmbeddingCache:
+    """Shared cache per (model, dims), rooted at EMBEDDING_CACHE_DIR (default .cache/embeddings)."""
+    with _caches_lock:
+        key = (model, dims)
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(model, dims, Path(os.getenv("EMBEDDING_CACHE_DIR", str(DEFAULT_CACHE_DIR))))
+        return _caches[key]
@@ -0,0 +1,306 @@
+"""
+Message-level Parquet export of every conversation folder, for analytics.
+
+    python export_messages_parquet.py                 # incremental update of message_table/
+    python export_messages_parquet.py --full          # rebuild everything
+
+Sources:
+    conversations_by_date/conversations_*.json                  (source "by_date", category = tag)
+    daily_conversation_analysis/DD_Mon_YYYY/conversations.json  (source "daily", category = tags)
+    <category>/messages.modified.json, else messages.json       (source "category", category = folder)
+
+Each message becomes one row with the columns in COLUMNS. The table is hive-partitioned by message
+date (message_table/date=YYYY-MM-DD/<source>.parquet), with one file per source file and date, so a
+changed source only rewrites its own files. message_table/_manifest.json records the size and mtime
+of every source at export time, and unchanged sources are skipped.
+
+    from export_messages_parquet import load_messages
+    import pyarrow.compute as pc
+    table = load_messages().to_table(
+        columns=["conv_id", "language"],
+        filter=(pc.field("date") >= "2025-11-01") & (pc.field("language") == "gu")
+        & (pc.field("role") == "user") & ~pc.field("is_query_common"),
+    )
+
+pyarrow is only needed by this script (pip install pyarrow).
+"""
+
+import argparse
+import json
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from conversation_resolver import canonical_timestamp, conversation_fingerprint
+from daily_conversation_analysis.checkpoint import atomic_write_json
+from json_stream import iter_json_array
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ROOT = Path(__file__).parent
+OUTPUT_DIR = Path(os.getenv("MESSAGE_TABLE_DIR", str(ROOT / "message_table")))
+MANIFEST_NAME = "_manifest.json"
+# Bump when the columns or their meaning change; a manifest with another version triggers a full rebuild
+SCHEMA_VERSION = 1
+DAY_FOLDER_FORMAT = "%d_%b_%Y"
+UNKNOWN_DATE = "unknown"
+
+# (name, pyarrow type factory); the order is the column order of every file
+COLUMNS = [
+    ("source", lambda: pa.string()),
+    ("category", lambda: pa.string()),
+    ("conv_id", lambda: pa.string()),
+    ("farmer_id", lambda: pa.string()),
+    ("language", lambda: pa.string()),
+    ("message_index", lambda: pa.int32()),
+    ("role", lambda: pa.string()),
+    ("timestamp", lambda: pa.timestamp("ms", tz="UTC")),
+    ("content", lambda: pa.string()),
+    ("en", lambda: pa.string()),
+    ("transliteration", lambda: pa.string()),
+    ("standalone", lambda: pa.string()),
+    ("standalone_en", lambda: pa.string()),
+    ("is_query_common", lambda: pa.bool_()),
+    # Hits per store; null when the message was never sent to retrieval
+    ("retrieval_tools", lambda: pa.int32()),
+    ("retrieval_faq", lambda: pa.int32()),
+]
+
+
+def schema() -> "pa.Schema":
+    return pa.schema([(name, make_type()) for name, make_type in COLUMNS])
+
+
+def discover_sources(root: Path = ROOT) -> List[Tuple[str, Path, Optional[str]]]:
+    """(source, path, category) for every input file, in a stable order."""
+    sources = []
+    for path in sorted((root / "conversations_by_date").glob("conversations_*.json")):
+        sources.append(("by_date", path, None))
+    for folder in sorted((root / "daily_conversation_analysis").iterdir()):
+        if not (folder / "conversations.json").exists():
+            continue
+        try:
+            datetime.strptime(folder.name, DAY_FOLDER_FORMAT)
+        except ValueError:
+            continue
+        sources.append(("daily", folder / "conversations.json", None))
+    for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+        for name in ("messages.modified.json", "messages.json"):
+            if (folder / name).exists():
+                sources.append(("category", folder / name, folder.name))
+                break
+    return sources
+
+
+def source_stamp(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def file_slug(path: Path, root: Path = ROOT) -> str:
+    """File name for a source's partition files, e.g. daily_conversation_analysis__28_Nov_2025__conversations."""
+    relative = path.resolve().relative_to(root.resolve()).with_suffix("")
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", "__".join(relative.parts))
+
+
+def _conversation_id(conv: Dict) -> Optional[str]:
+    conv_id = conv.get("_id") or conv.get("conversation_id")
+    if isinstance(conv_id, dict):
+        conv_id = conv_id.get("$oid")
+    if conv_id:
+        return str(conv_id)
+    # Older exports have no id at all; the first-user-message fingerprint is stable across re-exports
+    return conversation_fingerprint(conv.get("messages", []))
+
+
+def _category(source: str, conv: Dict, folder_category: Optional[str]) -> Optional[str]:
+    if folder_category is not None:
+        return folder_category
+    if source == "by_date":
+        return conv.get("tag")
+    tags = conv.get("tags")
+    return ",".join(tags) if tags else None
+
+
+def _hit_count(retrieval, key: str) -> Optional[int]:
+    if not isinstance(retrieval, dict):
+        return None
+    return len(retrieval.get(key) or [])
+
+
+def iter_message_rows(source: str, path: Path, folder_category: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """(date, row) for every message of a source file, streaming one conversation at a time."""
+    for conv in iter_json_array(path):
+        if not isinstance(conv, dict):
+            continue
+        messages = conv.get("messages") or []
+        conv_id = _conversation_id(conv)
+        category = _category(source, conv, folder_category)
+        # Messages without a timestamp go to the partition of the last timestamped message before them
+        date = UNKNOWN_DATE
+        for index, message in enumerate(messages):
+            ts = canonical_timestamp(message.get("timestamp"))
+            timestamp = datetime.fromisoformat(ts.replace("Z", "+00:00")) if ts else None
+            if ts:
+                date = ts[:10]
+            common = message.get("is_query_common")
+            yield date, {
+                "source": source,
+                "category": category,
+                "conv_id": conv_id,
+                "farmer_id": conv.get("farmer_id"),
+                "language": conv.get("language"),
+                "message_index": index,
+                "role": message.get("role") or message.get("type"),
+                "timestamp": timestamp,
+                "content": message.get("content"),
+                "en": message.get("en"),
+                "transliteration": message.get("content_transliterated"),
+                "standalone": message.get("standalone_question"),
+                "standalone_en": message.get("standalone_en"),
+                "is_query_common": common if isinstance(common, bool) else None,
+                "retrieval_tools": _hit_count(message.get("retrieval"), "tools"),
+                "retrieval_faq": _hit_count(message.get("retrieval"), "faq"),
+            }
+
+
+def _write_table(columns: Dict[str, list], path: Path) -> None:
+    table = pa.table(columns, schema=schema())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # pyarrow.dataset skips dot-files, so a half-written file is never read
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        pq.write_table(table, str(tmp_path), compression="zstd")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def export_source(source: str, path: Path, category: Optional[str], output_dir: Path) -> Tuple[List[str], int]:
+    """Write the partition files of one source. Returns (files relative to output_dir, row count)."""
+    by_date: Dict[str, Dict[str, list]] = defaultdict(lambda: {name: [] for name, _ in COLUMNS})
+    rows = 0
+    for date, row in iter_message_rows(source, path, category):
+        columns = by_date[date]
+        for name, value in row.items():
+            columns[name].append(value)
+        rows += 1
+
+    slug = file_slug(path)
+    written = []
+    for date, columns in sorted(by_date.items()):
+        relative = f"date={date}/{slug}.parquet"
+        _write_table(columns, output_dir / relative)
+        written.append(relative)
+    return written, rows
+
+
+def _remove_files(output_dir: Path, files: List[str]) -> None:
+    for relative in files:
+        path = output_dir / relative
+        if path.exists():
+            path.unlink()
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass  # other sources still have files for this date
+
+
+def export_messages(output_dir: Path = OUTPUT_DIR, full: bool = False) -> Dict[str, int]:
+    """
+    Bring the message table up to date with the source files.
+
+    Returns:
+        {"sources": total, "exported": re-exported sources, "removed": sources gone from disk, "rows": rows written}
+    """
+    if pa is None:
+        raise ImportError("export_messages_parquet needs pyarrow: pip install pyarrow")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = {}
+    if manifest_path.exists() and not full:
+        with manifest_path.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("schema_version") != SCHEMA_VERSION:
+            print(f"Schema version changed ({manifest.get('schema_version')} -> {SCHEMA_VERSION}), rebuilding")
+            manifest = {}
+    entries: Dict[str, Dict] = manifest.get("sources", {})
+    if not manifest:
+        # Full rebuild: drop whatever an older export left behind
+        for old in output_dir.glob("date=*/*.parquet"):
+            old.unlink()
+
+    sources = discover_sources()
+    current = {str(path.relative_to(ROOT)) for _, path, _ in sources}
+    stats = {"sources": len(sources), "exported": 0, "removed": 0, "rows": 0}
+
+    for key in sorted(set(entries) - current):
+        _remove_files(output_dir, entries.pop(key)["files"])
+        stats["removed"] += 1
+
+    for source, path, category in tqdm(sources, desc="Sources", unit="file"):
+        key = str(path.relative_to(ROOT))
+        stamp = source_stamp(path)
+        entry = entries.get(key)
+        if entry and entry["stamp"] == stamp and all((output_dir / f).exists() for f in entry["files"]):
+            continue
+        try:
+            files, rows = export_source(source, path, category, output_dir)
+        except Exception as e:
+            print(f"Error exporting {path}: {str(e)}")
+            continue
+        if entry:
+            _remove_files(output_dir, [f for f in entry["files"] if f not in files])
+        entries[key] = {"stamp": stamp, "files": files, "rows": rows}
+        stats["exported"] += 1
+        stats["rows"] += rows
+        # Saved after every source, so an interrupted run keeps what it finished
+        atomic_write_json(manifest_path, {"schema_version": SCHEMA_VERSION, "sources": entries}, indent=2)
+
+    atomic_write_json(manifest_path, {"schema_version": SCHEMA_VERSION, "sources": entries}, indent=2)
+    return stats
+
+
+def load_messages(output_dir: Path = OUTPUT_DIR) -> "ds.Dataset":
+    """The exported table as a pyarrow dataset; `date` is available as a partition column."""
+    if pa is None:
+        raise ImportError("load_messages needs pyarrow: pip install pyarrow")
+    return ds.dataset(
+        str(output_dir),
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+        schema=schema().append(pa.field("date", pa.string())),
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export all conversation folders to a message-level Parquet table")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR, help="Table directory")
+    parser.add_argument("--full", action="store_true", help="Re-export every source instead of only changed ones")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    stats = export_messages(args.output_dir, full=args.full)
+    print(
+        f"Exported {stats['exported']} of {stats['sources']} sources ({stats['rows']} messages), "
+        f"removed {stats['removed']} stale sources -> {args.output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
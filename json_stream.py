@@ -0,0 +1,224 @@
+"""
+Streaming JSON I/O for the multi-megabyte conversation files.
+
+- iter_json_array: yields the elements of a top-level JSON array one at a time, reading the
+  file in chunks and decoding each element with the C-accelerated json scanner, so memory
+  stays at one element plus one read buffer whatever the file size.
+- iter_jsonl: yields one object per line.
+- JsonArrayWriter / JsonlWriter: write elements incrementally to a temp file that replaces
+  the target atomically on close (never on error), in the same layout json.dump(..., indent=2)
+  produces.
+- count_json_array: constant-memory element count.
+- iter_batches: groups a stream into fixed-size lists for steps that work in bulk
+  (Mongo lookups, batched API calls).
+
+When orjson is installed it is used to encode elements and to decode JSONL lines; the
+stdlib json module is the fallback.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+READ_CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def _dumps(obj: Any, indent: Optional[int], default: Optional[Callable]) -> str:
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_INDENT_2 if indent == 2 else 0
+        try:
+            return orjson.dumps(obj, option=option | orjson.OPT_NON_STR_KEYS, default=default).decode("utf-8")
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the stdlib handles them
+    separators = None if indent is not None else (",", ":")
+    return json.dumps(obj, ensure_ascii=False, indent=indent, separators=separators, default=default)
+
+
+def _loads(text) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def iter_json_array(path, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Yield the elements of the JSON array in path one at a time.
+    A file holding a single top-level object yields that object.
+    """
+    with Path(path).open("r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            if eof:
+                return False
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip(chars: str) -> Optional[str]:
+            """Skip chars; return the next character (reading more as needed), None at EOF."""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not fill():
+                    return None
+
+        first = skip(_WHITESPACE)
+        if first is None:
+            return
+        if first != "[":
+            while fill():
+                pass
+            yield _decoder.decode(buffer[pos:])
+            return
+        pos += 1
+
+        while True:
+            nxt = skip(_WHITESPACE + ",")
+            if nxt is None:
+                raise ValueError(f"{path}: unterminated JSON array")
+            if nxt == "]":
+                return
+            while True:
+                try:
+                    value, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    value, end = None, None
+                # A value not followed by a delimiter may be truncated (e.g. "3" of "3.5")
+                if end is not None and end < len(buffer) and buffer[end] in _DELIMITERS:
+                    break
+                if not fill():
+                    if end is None:
+                        raise ValueError(f"{path}: invalid or truncated JSON at offset {pos}")
+                    break
+            pos = end
+            yield value
+
+
+def iter_jsonl(path) -> Iterator[Any]:
+    """Yield one object per non-empty line; a partially written last line is skipped."""
+    with Path(path).open("rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield _loads(line)
+            except ValueError:
+                continue
+
+
+def iter_conversations(path) -> Iterator[Dict]:
+    """Conversations from a .jsonl file or a JSON array file."""
+    return iter_jsonl(path) if str(path).endswith(".jsonl") else iter_json_array(path)
+
+
+def count_json_array(path) -> int:
+    return sum(1 for _ in iter_json_array(path))
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Group a stream into lists of at most size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _AtomicWriter:
+    def __init__(self, path, default: Optional[Callable] = str):
+        self.path = Path(path)
+        self.default = default
+        self.count = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=str(self.path.parent), prefix=f".{self.path.name}.", suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def _finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Finish the file and move it into place."""
+        if self._file is None:
+            return
+        self._finish()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Discard everything written; the target file is left untouched."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class JsonArrayWriter(_AtomicWriter):
+    """
+    Incrementally write a JSON array.
+
+        with JsonArrayWriter(path) as out:
+            for conv in conversations:
+                out.write(conv)
+    """
+
+    def __init__(self, path, indent: Optional[int] = 2, default: Optional[Callable] = str):
+        super().__init__(path, default)
+        self.indent = indent
+        self._file.write("[")
+
+    def write(self, obj: Any) -> None:
+        text = _dumps(obj, self.indent, self.default)
+        if self.indent:
+            pad = " " * self.indent
+            text = "\n" + pad + text.replace("\n", "\n" + pad)
+        self._file.write(("," if self.count else "") + text)
+        self.count += 1
+
+    def _finish(self) -> None:
+        self._file.write("\n]" if self.count and self.indent else "]")
+
+
+class JsonlWriter(_AtomicWriter):
+    """Incrementally write one JSON object per line."""
+
+    def write(self, obj: Any) -> None:
+        self._file.write(_dumps(obj, None, self.default) + "\n")
+        self.count += 1
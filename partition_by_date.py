@@ -0,0 +1,269 @@
+"""
+Single-pass date partitioner for transliterated_non_retrieval/.
+
+Replaces test3.py (load everything, sort, write conversations_sorted_by_date.json) followed by
+conv_by_date.py (load that file again, bucket by date):
+
+    python partition_by_date.py              # update conversations_by_date/
+    python partition_by_date.py --sorted     # also write conversations_sorted_by_date.json
+
+Every conversation gets the same `tag` and `conv_date` fields test3.py added and lands in
+conversations_by_date/conversations_<date>.json, newest first (ties by tag, then input order),
+exactly as before.
+
+Source files are streamed once into a temporary SQLite spool, which sorts each date on disk, and
+the date files are written one at a time, so memory is bounded by one conversation rather than the
+whole corpus. The globally sorted file is an external merge of the date files, which are already
+sorted runs.
+
+conversations_by_date/.manifest.json records the size and mtime of every input and the dates it
+contributed. A re-run only reads changed inputs, plus unchanged inputs that share a date with
+them, and only rewrites the dates those inputs touch.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from daily_conversation_analysis.checkpoint import atomic_write_json
+from json_stream import JsonArrayWriter, JsonlWriter, iter_conversations, iter_json_array
+
+SRC_DIR = Path("transliterated_non_retrieval")
+OUTPUT_DIR = Path("conversations_by_date")
+SORTED_PATH = Path("conversations_sorted_by_date.json")
+MANIFEST_NAME = ".manifest.json"
+# Most files held open at once by the external merge; more runs are merged in several passes
+MERGE_FAN_IN = 128
+
+
+def parse_mongo_date(zstr):
+    if zstr.endswith("Z"):
+        return datetime.fromisoformat(zstr[:-1]).replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(zstr)
+
+
+def extract_tag(path):
+    name = path.name
+    if name.startswith("transliterated_"):
+        name = name[len("transliterated_"):]
+    suffix = "_messages.modified_2.json"
+    if name.endswith(suffix):
+        name = name[: -len(suffix)]
+    return name
+
+
+def sort_key(conv: Dict) -> Tuple[float, str]:
+    """Newest first, then by tag: the order of conversations_sorted_by_date.json."""
+    return -datetime.fromisoformat(conv["conv_date"]).timestamp(), conv["tag"]
+
+
+def date_path(output_dir: Path, date: str) -> Path:
+    return output_dir / f"conversations_{date}.json"
+
+
+def input_stamp(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def iter_tagged(path: Path) -> Iterator[Tuple[int, datetime, Dict]]:
+    """(position, first message time, conversation with tag and conv_date) for one source file."""
+    tag = extract_tag(path)
+    for position, conv in enumerate(iter_json_array(path)):
+        messages = conv.get("messages", [])
+        if not messages:
+            continue
+        ts_raw = (messages[0].get("timestamp") or {}).get("$date")
+        if not ts_raw:
+            print(f"Skipping conversation {position} of {path}: first message has no timestamp")
+            continue
+        dt = parse_mongo_date(ts_raw)
+        conv_copy = dict(conv)
+        conv_copy["tag"] = tag
+        conv_copy["conv_date"] = dt.isoformat()
+        yield position, dt, conv_copy
+
+
+class DateSpool:
+    """Temporary on-disk table of conversations, read back one date at a time in output order."""
+
+    def __init__(self, directory: str):
+        self._conn = sqlite3.connect(os.path.join(directory, "spool.sqlite3"))
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE spool (date TEXT NOT NULL, ts REAL NOT NULL, tag TEXT NOT NULL, "
+            "file_index INTEGER NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL)"
+        )
+
+    def add(self, rows: Iterable[Tuple[str, float, str, int, int, str]]) -> None:
+        self._conn.executemany("INSERT INTO spool VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+
+    def finish(self) -> None:
+        self._conn.execute("CREATE INDEX idx_spool_order ON spool (date, ts DESC, tag, file_index, position)")
+
+    def dates(self) -> Set[str]:
+        return {date for (date,) in self._conn.execute("SELECT DISTINCT date FROM spool")}
+
+    def iter_date(self, date: str) -> Iterator[Dict]:
+        cursor = self._conn.execute(
+            "SELECT data FROM spool WHERE date = ? ORDER BY ts DESC, tag, file_index, position", (date,)
+        )
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def spool_file(spool: DateSpool, path: Path, file_index: int, wanted_dates: Optional[Set[str]] = None) -> Set[str]:
+    """Spool a source file (only wanted_dates, if given). Returns every date the file contains."""
+    dates = set()
+    batch = []
+    for position, dt, conv in iter_tagged(path):
+        date = conv["conv_date"].split("T")[0]
+        dates.add(date)
+        if wanted_dates is not None and date not in wanted_dates:
+            continue
+        batch.append((date, dt.timestamp(), conv["tag"], file_index, position, json.dumps(conv, ensure_ascii=False)))
+        if len(batch) >= 1000:
+            spool.add(batch)
+            batch = []
+    spool.add(batch)
+    return dates
+
+
+def merge_sorted(paths: List[Path], output_path: Path, fan_in: int = MERGE_FAN_IN) -> int:
+    """
+    External k-way merge of files that are each sorted by sort_key into one JSON array.
+    At most fan_in files are open at once. Returns the number of conversations written.
+    """
+    with tempfile.TemporaryDirectory(prefix="merge_", dir=str(output_path.parent.resolve())) as tmp_dir:
+        runs = list(paths)
+        generation = 0
+        while len(runs) > fan_in:
+            merged = []
+            for start in range(0, len(runs), fan_in):
+                run_path = Path(tmp_dir) / f"run_{generation}_{start}.jsonl"
+                with JsonlWriter(run_path) as out:
+                    for conv in heapq.merge(*(iter_conversations(p) for p in runs[start:start + fan_in]), key=sort_key):
+                        out.write(conv)
+                merged.append(run_path)
+            runs = merged
+            generation += 1
+        with JsonArrayWriter(output_path) as out:
+            for conv in heapq.merge(*(iter_conversations(p) for p in runs), key=sort_key):
+                out.write(conv)
+    return out.count
+
+
+def load_manifest(output_dir: Path) -> Dict[str, Dict]:
+    path = output_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("inputs", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def partition_conversations(
+    src_dir: Path = SRC_DIR,
+    output_dir: Path = OUTPUT_DIR,
+    sorted_path: Optional[Path] = None,
+    full: bool = False,
+) -> Dict[str, int]:
+    """
+    Bring output_dir up to date with src_dir, and sorted_path too when given.
+
+    Returns:
+        {"inputs_read": n, "dates_written": n, "dates_removed": n}
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {} if full else load_manifest(output_dir)
+    inputs = sorted(src_dir.glob("*.json"))
+    stamps = {str(path): input_stamp(path) for path in inputs}
+
+    changed = [
+        path for path in inputs
+        if str(path) not in manifest
+        or manifest[str(path)]["stamp"] != stamps[str(path)]
+        or not all(date_path(output_dir, d).exists() for d in manifest[str(path)]["dates"])
+    ]
+    removed = [key for key in manifest if key not in stamps]
+    # Dates that lose conversations from changed or removed inputs must be rebuilt too
+    affected = {d for key in removed for d in manifest[key]["dates"]}
+    affected |= {d for path in changed for d in manifest.get(str(path), {}).get("dates", [])}
+
+    stats = {"inputs_read": 0, "dates_written": 0, "dates_removed": 0}
+    new_manifest = {key: entry for key, entry in manifest.items() if key in stamps}
+    if changed or removed or full:
+        with tempfile.TemporaryDirectory(prefix="partition_") as tmp_dir:
+            spool = DateSpool(tmp_dir)
+            index = {path: i for i, path in enumerate(inputs)}
+            for path in changed:
+                dates = spool_file(spool, path, index[path])
+                new_manifest[str(path)] = {"stamp": stamps[str(path)], "dates": sorted(dates)}
+                affected |= dates
+                stats["inputs_read"] += 1
+            # Unchanged inputs only contribute the affected dates
+            for path in inputs:
+                if path in changed or not affected.intersection(manifest[str(path)]["dates"]):
+                    continue
+                spool_file(spool, path, index[path], wanted_dates=affected)
+                stats["inputs_read"] += 1
+            spool.finish()
+
+            present = spool.dates()
+            for date in sorted(affected):
+                if date in present:
+                    with JsonArrayWriter(date_path(output_dir, date)) as out:
+                        for conv in spool.iter_date(date):
+                            out.write(conv)
+                    stats["dates_written"] += 1
+                elif date_path(output_dir, date).exists():
+                    date_path(output_dir, date).unlink()
+                    stats["dates_removed"] += 1
+            spool.close()
+        if full:
+            # Without the old manifest nothing knows which inputs went away, so drop every date
+            # file the rebuild did not produce
+            for path in output_dir.glob("conversations_*.json"):
+                if path.stem[len("conversations_"):] not in present:
+                    path.unlink()
+                    stats["dates_removed"] += 1
+        atomic_write_json(output_dir / MANIFEST_NAME, {"inputs": new_manifest}, indent=2)
+
+    if sorted_path is not None and (stats["dates_written"] or stats["dates_removed"] or not sorted_path.exists()):
+        dates = sorted({d for entry in new_manifest.values() for d in entry["dates"]})
+        count = merge_sorted([date_path(output_dir, d) for d in dates], sorted_path)
+        print(f"Saved {count} conversations to {sorted_path}")
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Split transliterated_non_retrieval/ into conversations_by_date/")
+    parser.add_argument("--sorted", action="store_true", help=f"Also write {SORTED_PATH} (all conversations, newest first)")
+    parser.add_argument("--full", action="store_true", help="Rebuild every date instead of only changed ones")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    stats = partition_conversations(sorted_path=SORTED_PATH if args.sorted else None, full=args.full)
+    print(
+        f"Read {stats['inputs_read']} input files, wrote {stats['dates_written']} dates, "
+        f"removed {stats['dates_removed']} dates -> {OUTPUT_DIR}"
+    )
+
+
+if __name__ == "__main__":
+    main()
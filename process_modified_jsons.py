@@ -1,14 +1,22 @@
+import argparse
 import json
+import os
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 from tqdm import tqdm
 from dotenv import load_dotenv
 from langchain.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 
-from mongo_uri_test import find_doc
+from conversation_resolver import conversation_fingerprint, get_resolver
+from daily_conversation_analysis.checkpoint import CheckpointLog, atomic_write_json
+from daily_conversation_analysis.concurrency import TokenBucket, iter_concurrently, run_concurrently
+from embedding_cache import get_embedding_cache
+from retrieval_service import get_client
 from gpt_4o_mini import to_standalone_question_openai
 from azure_translation import translate_to_en
 
@@ -17,6 +25,23 @@ load_dotenv("../.env")
 
 
 STATE_FILE = Path(".processed_conversations.json")
+# Queries per embed_documents request during batched retrieval
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Messages buffered before a batched retrieval (and the checkpoint of the finished conversations)
+RETRIEVAL_BATCH_SIZE = int(os.getenv("RETRIEVAL_BATCH_SIZE", "256"))
+FILE_WORKERS = int(os.getenv("PROCESS_FILE_WORKERS", "2"))
+CONVERSATION_WORKERS = int(os.getenv("PROCESS_CONVERSATION_WORKERS", "4"))
+# Combined rate of standalone / translation API calls across all workers
+REQUESTS_PER_SECOND = float(os.getenv("PROCESS_REQUESTS_PER_SECOND", "4"))
+
+_embeddings: Optional[OpenAIEmbeddings] = None
+
+
+def get_embeddings() -> OpenAIEmbeddings:
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(model="text-embedding-3-small", dimensions=512)
+    return _embeddings
 
 
 def load_state() -> Dict[str, List[str]]:
@@ -32,9 +57,21 @@ def load_state() -> Dict[str, List[str]]:
         return {}
 
 
+_state_lock = threading.Lock()
+
+
 def save_state(state: Dict[str, List[str]]) -> None:
-    with STATE_FILE.open("w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    with _state_lock:
+        atomic_write_json(STATE_FILE, state, ensure_ascii=False, indent=2)
+
+
+def mark_processed(state: Dict[str, List[str]], file_path: Path, conv_ids: List[str]) -> None:
+    """Add conv_ids to the file's processed list and persist the state file atomically."""
+    with _state_lock:
+        existing = set(state.get(str(file_path), []))
+        existing.update(conv_ids)
+        state[str(file_path)] = sorted(existing)
+    save_state(state)
 
 
 def discover_message_files() -> List[Path]:
@@ -62,7 +99,7 @@ def build_chat_history(messages: List[Dict]) -> str:
     return "\n".join(parts)
 
 
-def ensure_standalone_question_for_messages(messages: List[Dict]) -> None:
+def ensure_standalone_question_for_messages(messages: List[Dict], rate_limiter: Optional[TokenBucket] = None) -> None:
     for idx, m in enumerate(messages):
         if m.get("role") != "user":
             continue
@@ -75,6 +112,8 @@ def ensure_standalone_question_for_messages(messages: List[Dict]) -> None:
             m["standalone_question"] = "message is empty"
             continue
         chat_history = build_chat_history(messages[:idx])
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         standalone = to_standalone_question_openai(chat_history, f"user: {latest_user_query}")
         if isinstance(standalone, str) and len(standalone.strip()) > 0:
             m["standalone_question"] = standalone
@@ -82,7 +121,7 @@ def ensure_standalone_question_for_messages(messages: List[Dict]) -> None:
             m["standalone_question"] = ""
 
 
-def ensure_en_translation_for_messages(messages: List[Dict]) -> None:
+def ensure_en_translation_for_messages(messages: List[Dict], rate_limiter: Optional[TokenBucket] = None) -> None:
     for m in messages:
         if "standalone_en" in m and isinstance(m["standalone_en"], str) and len(m["standalone_en"].strip()) > 0:
             continue
@@ -96,6 +135,8 @@ def ensure_en_translation_for_messages(messages: List[Dict]) -> None:
         if not isinstance(content, str) or len(content.strip()) == 0:
             continue
         try:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
             translated = translate_to_en(content).strip()
             if translated:
                 m["standalone_en"] = translated
@@ -107,7 +148,7 @@ def ensure_en_translation_for_messages(messages: List[Dict]) -> None:
 
 
 def load_vstores() -> Tuple[FAISS, FAISS]:
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small", dimensions=512)
+    embeddings = get_embeddings()
     tools_store: Optional[FAISS] = None
     faq_store: Optional[FAISS] = None
     # try:
@@ -121,82 +162,208 @@ def load_vstores() -> Tuple[FAISS, FAISS]:
     return tools_store, faq_store
 
 
-def retrieve_from_stores(query: str, tools_store: Optional[FAISS], faq_store: Optional[FAISS], threshold: float = 1.0, k: int = 5) -> Dict[str, List[str]]:
-    results: Dict[str, List[str]] = {"tools": [], "faq": []}
-    if tools_store is not None:
-        docs_scores = tools_store.similarity_search_with_score(query, k=k)
-        results["tools"] = [d.page_content for d, s in docs_scores if s <= threshold]
-    if faq_store is not None:
-        docs_scores = faq_store.similarity_search_with_score(query, k=k)
-        results["faq"] = [d.page_content for d, s in docs_scores if s <= threshold]
+def embed_queries(queries: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    Embed queries with batched embed_documents calls, skipping texts already in the persistent
+    embedding cache. Returns a float32 (n, dim) array.
+    """
+    cache = get_embedding_cache("text-embedding-3-small", 512)
+    return cache.embed(queries, get_embeddings().embed_documents, batch_size=batch_size)
+
+
+def search_store(store: Optional[FAISS], vectors: np.ndarray, threshold: float, k: int) -> List[List[str]]:
+    """
+    One index.search over all query vectors; keeps hits with L2 distance <= threshold, the same
+    scores similarity_search_with_score returns.
+    """
+    if store is None or len(vectors) == 0 or store.index.ntotal == 0:
+        return [[] for _ in range(len(vectors))]
+    distances, indices = store.index.search(vectors, min(k, store.index.ntotal))
+    keep = (indices >= 0) & (distances <= threshold)
+    results: List[List[str]] = []
+    for row, row_keep in zip(indices, keep):
+        results.append([store.docstore.search(store.index_to_docstore_id[int(i)]).page_content for i in row[row_keep]])
     return results
 
 
-def process_file(file_path: Path, state: Dict[str, List[str]], tools_store: FAISS, faq_store: FAISS) -> int:
+def retrieve_batch(queries: List[str], tools_store: Optional[FAISS], faq_store: Optional[FAISS], threshold: float = 1.0, k: int = 5) -> List[Dict[str, List[str]]]:
+    """
+    Retrieve for many queries at once; duplicate queries are embedded and searched once.
+    Goes through the warm retrieval daemon when RETRIEVAL_SERVICE_URL is set and no stores were
+    loaded (main loads them when the daemon is unreachable).
+    """
+    unique = list(dict.fromkeys(queries))
+    if not unique:
+        return []
+    client = get_client()
+    if client is not None and tools_store is None and faq_store is None:
+        hits = client.search(unique, threshold=threshold, k=k)
+        by_query = {q: {key: [h["content"] for h in h_list] for key, h_list in hit.items()} for q, hit in zip(unique, hits)}
+        return [{"tools": list(by_query[q]["tools"]), "faq": list(by_query[q]["faq"])} for q in queries]
+    vectors = embed_queries(unique)
+    tools = search_store(tools_store, vectors, threshold, k)
+    faq = search_store(faq_store, vectors, threshold, k)
+    by_query = {q: {"tools": t, "faq": f} for q, t, f in zip(unique, tools, faq)}
+    return [{"tools": list(by_query[q]["tools"]), "faq": list(by_query[q]["faq"])} for q in queries]
+
+
+def retrieve_from_stores(query: str, tools_store: Optional[FAISS], faq_store: Optional[FAISS], threshold: float = 1.0, k: int = 5) -> Dict[str, List[str]]:
+    return retrieve_batch([query], tools_store, faq_store, threshold=threshold, k=k)[0]
+
+
+def checkpoint_key(conv: Dict) -> str:
+    # messages.json conversations have no _id; the first user message identifies them
+    return conversation_fingerprint(conv.get("messages", [])) or ""
+
+
+def prepare_conversation(conv: Dict, checkpoint: CheckpointLog, rate_limiter: Optional[TokenBucket] = None) -> List[Tuple[int, str]]:
+    """
+    Fill in standalone questions and translations for one conversation, checkpoint them, and
+    return the (message index, query) pairs that still need retrieval.
+    """
+    messages = conv.get("messages", [])
+    ensure_standalone_question_for_messages(messages, rate_limiter)
+    ensure_en_translation_for_messages(messages, rate_limiter)
+    for idx, m in enumerate(messages):
+        fields = {k: m[k] for k in ("standalone_question", "standalone_en") if k in m}
+        if fields:
+            checkpoint.record(conv, idx, fields)
+
+    pending: List[Tuple[int, str]] = []
+    for idx, m in enumerate(messages):
+        if "retrieval" in m and m["retrieval"]:
+            continue
+        if m.get("role") != "user":
+            continue
+        if idx % 2 != 0:
+            continue
+        latest_user_query = m.get("content", "")
+        if not isinstance(latest_user_query, str) or len(latest_user_query.strip()) == 0:
+            continue
+        text_for_retrieval = m.get("standalone_en") or m.get("standalone_question") or latest_user_query or ""
+        pending.append((idx, text_for_retrieval.strip()))
+    return pending
+
+
+def process_file(
+    file_path: Path,
+    state: Dict[str, List[str]],
+    tools_store: FAISS,
+    faq_store: FAISS,
+    workers: int = 1,
+    rate_limiter: Optional[TokenBucket] = None,
+) -> int:
+    """
+    Process the unprocessed conversations of one messages.json on `workers` threads.
+
+    Standalone / translation results are checkpointed per conversation as soon as they are
+    computed, and retrieval runs in batches of RETRIEVAL_BATCH_SIZE messages; a conversation is
+    added to the state file once its retrieval is checkpointed. A crashed run resumes from the
+    checkpoint log and the state file, and messages.modified.json is rewritten atomically once at
+    the end of the file.
+    """
     modified_path = file_path.with_name(f"{file_path.stem}.modified.json")
     read_path = modified_path if modified_path.exists() else file_path
     with read_path.open("r", encoding="utf-8") as f:
         conversations = json.load(f)
 
+    checkpoint = CheckpointLog(modified_path, key_fn=checkpoint_key)
+    replayed = checkpoint.replay(conversations)
+
     processed_for_file = set(state.get(str(file_path), []))
-    new_processed = []
-    updated_count = 0
+    resolver = get_resolver()
+    records = resolver.resolve_many(conv.get("messages", []) for conv in conversations)
 
-    for conv in tqdm(conversations):
-        messages = conv.get("messages", [])
-        doc = find_doc(messages)
-        conv_id = None if doc is None else doc.get("_id")
+    todo: List[Tuple[Dict, str]] = []
+    for conv, record in zip(conversations, records):
+        conv_id = None if record is None else record.get("_id")
         if conv_id is None:
             continue
         conv_id_str = str(conv_id)
         if conv_id_str in processed_for_file:
             continue
+        todo.append((conv, conv_id_str))
 
-        ensure_standalone_question_for_messages(messages)
-        ensure_en_translation_for_messages(messages)
-
-        for idx, m in enumerate(messages):
-            if "retrieval" in m and m["retrieval"]:
-                continue
-            if m.get("role") != "user":
-                continue
-            if idx % 2 != 0:
-                continue
-            latest_user_query = m.get("content", "")
-            if not isinstance(latest_user_query, str) or len(latest_user_query.strip()) == 0:
-                continue
-            text_for_retrieval = m.get("standalone_en") or m.get("standalone_question") or latest_user_query or ""
-            text_for_retrieval = text_for_retrieval.strip()
-            retrieval = retrieve_from_stores(text_for_retrieval, tools_store, faq_store, threshold=1.0, k=5)
-            m["retrieval"] = retrieval
-
-        conv["conversation_id"] = conv_id_str
-
-        new_processed.append(conv_id_str)
-        updated_count += 1
+    updated_count = 0
+    buffer: List[Tuple[Dict, str, List[Tuple[int, str]]]] = []
+
+    def flush() -> None:
+        nonlocal updated_count
+        if not buffer:
+            return
+        queries = [text for _, _, pending in buffer for _, text in pending]
+        if queries:
+            print(f"Retrieving for {len(queries)} messages in {file_path}")
+        retrievals = iter(retrieve_batch(queries, tools_store, faq_store, threshold=1.0, k=5))
+        finished = []
+        for conv, conv_id_str, pending in buffer:
+            messages = conv.get("messages", [])
+            for idx, _ in pending:
+                messages[idx]["retrieval"] = next(retrievals)
+                checkpoint.record(conv, idx, {"retrieval": messages[idx]["retrieval"]})
+            conv["conversation_id"] = conv_id_str
+            checkpoint.record(conv, None, {"conversation_id": conv_id_str})
+            finished.append(conv_id_str)
+        mark_processed(state, file_path, finished)
+        updated_count += len(finished)
+        buffer.clear()
+
+    results = iter_concurrently(
+        lambda item: prepare_conversation(item[0], checkpoint, rate_limiter),
+        todo,
+        max_workers=workers,
+    )
+    for (conv, conv_id_str), pending in tqdm(results, total=len(todo), desc=file_path.parent.name):
+        buffer.append((conv, conv_id_str, pending))
+        if sum(len(p) for _, _, p in buffer) >= RETRIEVAL_BATCH_SIZE:
+            flush()
+    flush()
+
+    if updated_count > 0 or replayed:
+        checkpoint.compact(conversations)
+    else:
+        checkpoint.close()
 
-    if updated_count > 0:
-        with modified_path.open("w", encoding="utf-8") as f:
-            json.dump(conversations, f, ensure_ascii=False, indent=2)
+    return updated_count
 
-    if new_processed:
-        existing = set(state.get(str(file_path), []))
-        existing.update(new_processed)
-        state[str(file_path)] = sorted(existing)
 
-    return updated_count
+def parse_args():
+    parser = argparse.ArgumentParser(description="Add standalone questions, translations and retrieval to */messages.json")
+    parser.add_argument("--file-workers", type=int, default=FILE_WORKERS, help="Files processed at the same time")
+    parser.add_argument("--workers", type=int, default=CONVERSATION_WORKERS, help="Conversations processed at the same time per file")
+    parser.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND, help="Combined API request rate (<= 0 disables limiting)")
+    return parser.parse_args()
 
 
 def main() -> None:
+    args = parse_args()
     files = discover_message_files()
     state = load_state()
-    tools_store, faq_store = load_vstores()
-    total_updated = 0
-    for fpath in files:
-        updated = process_file(fpath, state, tools_store, faq_store)
-        total_updated += updated
+    client = get_client()
+    tools_store, faq_store = None, None
+    if client is not None:
+        try:
+            print(f"Using retrieval service at {client.url}: {client.health()}")
+        except OSError as e:
+            print(f"Retrieval service at {client.url} is not reachable ({e}), loading the vstores in-process")
+            client = None
+    if client is None:
+        tools_store, faq_store = load_vstores()
+    rate_limiter = TokenBucket(args.requests_per_second)
+    updated = run_concurrently(
+        lambda fpath: process_file(fpath, state, tools_store, faq_store, workers=args.workers, rate_limiter=rate_limiter),
+        files,
+        max_workers=args.file_workers,
+        desc="Files",
+        unit="file",
+    )
+    total_updated = sum(updated)
 
     save_state(state)
+    get_resolver().print_stats()
+    if client is None:
+        # The daemon keeps its own cache; these are the in-process retrieval embeddings
+        get_embedding_cache("text-embedding-3-small", 512).print_stats()
     print(json.dumps({
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "files_processed": len(files),
@@ -206,4 +373,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-
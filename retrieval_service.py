@@ -0,0 +1,199 @@
+"""
+Warm retrieval daemon for the vstore FAISS indexes.
+
+    python retrieval_service.py                # serve on 127.0.0.1:8765
+    RETRIEVAL_SERVICE_URL=http://127.0.0.1:8765 python process_modified_jsons.py
+
+The `tools` and `irrigation` indexes are loaded once (memory-mapped with faiss.IO_FLAG_MMAP, so
+the OS page cache is shared with any other process mapping the same file) and their document
+texts are kept in a list, so a query is an embedding lookup plus one index.search. Scripts talk
+to it through RetrievalClient instead of paying FAISS.load_local and pickle deserialization on
+every run.
+
+Endpoints:
+    GET  /health  -> {"stores": {"tools": <ntotal>, "faq": <ntotal>}}
+    POST /search  {"queries": [...], "k": 5, "threshold": 1.0}
+                  -> {"results": [{"tools": [{"content": str, "score": float}], "faq": [...]}, ...]}
+"""
+
+import json
+import os
+import pickle
+import sys
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embedding_cache import get_embedding_cache
+
+
+VSTORE_DIR = Path(os.getenv("VSTORE_DIR", str(Path(__file__).parent / "vstore")))
+# Response key -> index name in vstore/
+STORES = {"tools": "tools", "faq": "irrigation"}
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMS = 512
+HOST = os.getenv("RETRIEVAL_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("RETRIEVAL_SERVICE_PORT", "8765"))
+
+
+class LoadedIndex:
+    """A FAISS index plus the page content of every vector, in index order."""
+
+    def __init__(self, vstore_dir: Path, index_name: str):
+        import faiss
+
+        index_path = vstore_dir / f"{index_name}.faiss"
+        try:
+            self.index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            # Not every index type supports mmap
+            self.index = faiss.read_index(str(index_path))
+        with (vstore_dir / f"{index_name}.pkl").open("rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        self.contents = [docstore.search(index_to_docstore_id[i]).page_content for i in range(self.index.ntotal)]
+
+    def search(self, vectors: np.ndarray, threshold: float, k: int) -> List[List[Dict]]:
+        """One index.search for all vectors; hits with L2 distance <= threshold."""
+        if len(vectors) == 0 or self.index.ntotal == 0:
+            return [[] for _ in range(len(vectors))]
+        distances, indices = self.index.search(vectors, min(k, self.index.ntotal))
+        keep = (indices >= 0) & (distances <= threshold)
+        return [
+            [{"content": self.contents[int(i)], "score": float(d)} for i, d in zip(row[row_keep], dist[row_keep])]
+            for row, dist, row_keep in zip(indices, distances, keep)
+        ]
+
+
+class RetrievalService:
+    def __init__(self, vstore_dir: Path = VSTORE_DIR):
+        self.stores = {key: LoadedIndex(vstore_dir, name) for key, name in STORES.items()}
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def embed(self, queries: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+                self._embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMS)
+        cache = get_embedding_cache(EMBEDDING_MODEL, EMBEDDING_DIMS)
+        return cache.embed(queries, self._embeddings.embed_documents, batch_size=256)
+
+    def search(self, queries: List[str], threshold: float = 1.0, k: int = 5) -> List[Dict[str, List[Dict]]]:
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return []
+        vectors = self.embed(unique)
+        hits = {key: store.search(vectors, threshold, k) for key, store in self.stores.items()}
+        by_query = {q: {key: hits[key][i] for key in hits} for i, q in enumerate(unique)}
+        return [by_query[q] for q in queries]
+
+
+def make_handler(service: RetrievalService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"stores": {key: store.index.ntotal for key, store in service.stores.items()}})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/search":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                queries = [str(q) for q in request["queries"]]
+                threshold = float(request.get("threshold", 1.0))
+                k = int(request.get("k", 5))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self._send(400, {"error": f"malformed request: {e}"})
+                return
+            try:
+                results = service.search(queries, threshold=threshold, k=k)
+            except Exception as e:
+                # Embedding API or index failures are the server's fault, not the caller's
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {"results": results})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class RetrievalClient:
+    """
+    Client for a running retrieval daemon.
+
+    Args:
+        url: Base URL, e.g. http://127.0.0.1:8765.
+        timeout: Seconds per request.
+        batch_size: Queries per /search request.
+    """
+
+    def __init__(self, url: str, timeout: float = 120, batch_size: int = 512):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+    def health(self) -> Dict:
+        with urllib.request.urlopen(f"{self.url}/health", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def search(self, queries: Sequence[str], threshold: float = 1.0, k: int = 5) -> List[Dict[str, List[Dict]]]:
+        """Per query {"tools": [{"content", "score"}], "faq": [...]}, in input order."""
+        results: List[Dict[str, List[Dict]]] = []
+        for start in range(0, len(queries), self.batch_size):
+            body = json.dumps({"queries": list(queries[start:start + self.batch_size]), "threshold": threshold, "k": k}).encode("utf-8")
+            request = urllib.request.Request(
+                f"{self.url}/search", data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                results.extend(json.loads(response.read())["results"])
+        return results
+
+
+_client: Optional[RetrievalClient] = None
+
+
+def get_client() -> Optional[RetrievalClient]:
+    """Client for RETRIEVAL_SERVICE_URL, or None when no daemon is configured."""
+    global _client
+    url = os.getenv("RETRIEVAL_SERVICE_URL")
+    if not url:
+        return None
+    if _client is None or _client.url != url.rstrip("/"):
+        _client = RetrievalClient(url)
+    return _client
+
+
+def serve(host: str = HOST, port: int = PORT) -> None:
+    print(f"Loading FAISS indexes from {VSTORE_DIR}...")
+    service = RetrievalService()
+    for key, store in service.stores.items():
+        print(f"  {key}: {store.index.ntotal} vectors")
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Retrieval service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT)
@@ -1,6 +1,7 @@
 import os
 import glob
-import json
+
+from json_stream import count_json_array
 
 def find_modified_json_files(root_dir="."):
     pattern = os.path.join(root_dir, "**", "messages.modified.json")
@@ -13,16 +14,9 @@ def count_json_objects():
     
     for path in file_paths:
         try:
-            with open(path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                if isinstance(data, list):
-                    count = len(data)
-                elif isinstance(data, dict):
-                    count = 1
-                else:
-                    count = 0
-                print(f"{path}: {count} objects")
-                total_objects += count
+            count = count_json_array(path)
+            print(f"{path}: {count} objects")
+            total_objects += count
         except Exception as e:
             print(f"Error reading {path}: {str(e)}")
     
@@ -1,31 +1,18 @@
+import argparse
 import os
 import glob
-import json
-from pymongo import MongoClient
+from pathlib import Path
 from dotenv import load_dotenv
-from datetime import datetime, timezone
 
-load_dotenv("../.env")
-
-client = MongoClient(os.getenv("FYLLO_MONGO_URI"))
-db = client["chat_database"]
-collection = db["conversations"]
+from conversation_filters import DateBetween, EmptyRetrieval, FarmerIn, LanguageIn, RolesInclude, filter_files
 
-def convert_dates(obj):
-    if isinstance(obj, dict):
-        if "$date" in obj and isinstance(obj["$date"], str):
-            return datetime.strptime(obj["$date"], "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
-        else:
-            return {k: convert_dates(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_dates(i) for i in obj]
-    else:
-        return obj
+load_dotenv("../.env")
 
-def find_doc(messages_value):
-    messages_value2 = convert_dates(messages_value)
-    doc = collection.find_one({"messages": messages_value2})
-    return doc
+# Drop conversations whose Mongo document is not a farmuser (non-admin) conversation
+FILTER_BY_ROLES = os.getenv("FILTER_BY_ROLES", "0") == "1"
+EXCLUDED_FARMERS = ['priyanshu', 'chaitanyarajwade', 'popatganore', "sinankit"]
+FILE_WORKERS = int(os.getenv("SEPARATE_FILE_WORKERS", "4"))
+MANIFEST_NAME = "_manifest.json"
 
 def create_non_retrieval_folder():
     folder_name = "non_retrieval"
@@ -41,88 +28,65 @@ def find_modified_json_files(root_dir="."):
     paths = glob.glob(pattern, recursive=True)
     return paths
 
-def has_empty_retrieval(message):
-    if message.get("role") == "user" and "retrieval" in message:
-        retrieval = message["retrieval"]
-        tools = retrieval.get("tools", [])
-        faq = retrieval.get("faq", [])
-        return len(tools) == 0 and len(faq) == 0
-    return False
+def output_path_for(output_folder, path):
+    folder_name = os.path.basename(os.path.dirname(path))
+    file_name = os.path.splitext(os.path.basename(path))[0]
+    return Path(output_folder) / f"{folder_name}_{file_name}.json"
 
-def should_filter_conversation(farmer_id, messages):
-    excluded_farmers = ['priyanshu', 'chaitanyarajwade', 'popatganore', "sinankit"]
-    if farmer_id in excluded_farmers:
-        return True
-    
-    # conv_doc = find_doc(messages)
-    # if not conv_doc:
-    #     return True
-    
-    # roles = conv_doc.get("roles")
-    # if not roles or "farmuser" not in roles:
-    #     return True
-    
-    # if "admin" in roles:
-    #     return True
-    
-    return False
+def build_predicate(filter_by_roles=FILTER_BY_ROLES, languages=None, since=None, until=None):
+    """Conversations of real farmers with at least one user message that retrieval found nothing for."""
+    predicate = ~FarmerIn(EXCLUDED_FARMERS) & EmptyRetrieval()
+    if since or until:
+        predicate &= DateBetween(since, until)
+    if languages:
+        predicate &= LanguageIn(languages)
+    if filter_by_roles:
+        predicate &= RolesInclude("farmuser") & ~RolesInclude("admin")
+    return predicate
 
-def separate_non_retrieval_objects():
+def separate_non_retrieval_objects(predicate=None, workers=FILE_WORKERS, write_manifest=False):
     output_folder = create_non_retrieval_folder()
     file_paths = find_modified_json_files()
+    results = filter_files(
+        file_paths,
+        predicate or build_predicate(),
+        output_for=lambda path: output_path_for(output_folder, path),
+        workers=workers,
+        manifest_path=Path(output_folder) / MANIFEST_NAME if write_manifest else None,
+    )
+
     total_separated = 0
-    total_filtered_by_farmer = 0
-    total_filtered_by_roles = 0
     total_objects = 0
-    for path in file_paths:
-        try:
-            with open(path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            total_objects += len(data)
-            non_retrieval_objects = []
-            
-            if isinstance(data, list):
-                for obj in data:
-                    if "messages" in obj:
-                        farmer_id = obj.get("farmer_id", "")
-                        messages = obj["messages"]
-                        
-                        if should_filter_conversation(farmer_id, messages):
-                            continue
-                        
-                        
-                        has_empty_retrieval_user = False
-                        for message in messages:
-                            if has_empty_retrieval(message):
-                                has_empty_retrieval_user = True
-                                break
-                        
-                        if has_empty_retrieval_user:
-                            non_retrieval_objects.append(obj)
-            
-            if non_retrieval_objects:
-                folder_name = os.path.basename(os.path.dirname(path))
-                file_name = os.path.splitext(os.path.basename(path))[0]
-                output_filename = f"{folder_name}_{file_name}.json"
-                output_path = os.path.join(output_folder, output_filename)
-                
-                with open(output_path, 'w', encoding='utf-8') as output_file:
-                    json.dump(non_retrieval_objects, output_file, indent=2, ensure_ascii=False)
-                
-                print(f"Separated {len(non_retrieval_objects)} objects from {path}")
-                print(f"Saved to: {output_path}")
-                total_separated += len(non_retrieval_objects)
-            else:
-                print(f"No non-retrieval objects found in {path}")
-                
-        except Exception as e:
-            print(f"Error processing {path}: {str(e)}")
+    for result in results:
+        path = result["source"]
+        if "error" in result:
+            print(f"Error processing {path}: {result['error']}")
+            continue
+        total_objects += result["scanned"]
+        if result["matches"]:
+            print(f"Separated {result['matches']} objects from {path}")
+            print(f"Saved to: {result['output']}")
+            total_separated += result["matches"]
+        else:
+            print(f"No non-retrieval objects found in {path}")
     
     print(f"\nFiltering Summary:")
-    # print(f"Total objects filtered by farmer_id: {total_filtered_by_farmer}")
-    # print(f"Total objects filtered by roles: {total_filtered_by_roles}")
     print(f"Total objects separated: {total_separated} out of {total_objects}")
     return total_separated
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Separate conversations with empty retrieval into non_retrieval/")
+    parser.add_argument("--workers", type=int, default=FILE_WORKERS, help="Files filtered at the same time")
+    parser.add_argument("--language", action="append", help="Keep only these conversation languages (repeatable)")
+    parser.add_argument("--since", help="Keep conversations started on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Keep conversations started on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--manifest", action="store_true", help=f"Write per-source match counts to non_retrieval/{MANIFEST_NAME}")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    separate_non_retrieval_objects()
+    args = parse_args()
+    separate_non_retrieval_objects(
+        build_predicate(languages=args.language, since=args.since, until=args.until),
+        workers=args.workers,
+        write_manifest=args.manifest,
+    )
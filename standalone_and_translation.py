@@ -16,7 +16,7 @@ load_dotenv("../.env")
 
 from sarvam_m import to_standalone_question
 from gpt_4o_mini import to_standalone_question_openai
-from mongo_uri_test import find_doc
+from conversation_resolver import get_resolver
 
 from collections import defaultdict
 
@@ -46,13 +46,14 @@ def main():
     with open(os.path.join("historical data", "messages.json"), "r", encoding="utf-8") as f:
         chats.extend(json.load(f))
 
+    conv_docs = get_resolver().resolve_many(chat.get("messages", []) for chat in chats)
+
     rows = []
-    for idx, chat in enumerate(tqdm(chats, total=len(chats))):
+    for idx, (chat, conv_doc) in enumerate(tqdm(zip(chats, conv_docs), total=len(chats))):
         # if idx >= 2:
         #     break
         messages = chat.get("messages", [])
         farmer_id = chat.get("farmer_id", "")
-        conv_doc = find_doc(messages)
         conv_id = conv_doc.get("_id") if conv_doc else None
         language = conv_doc.get("language") if conv_doc else None
         
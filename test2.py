@@ -1,7 +1,7 @@
 from pathlib import Path
 from datetime import datetime
 import json
-from mongo_uri_test import find_doc, find_doc_by_id
+from conversation_resolver import enrich_by_id
 
 def datetime_handler(obj):
     if isinstance(obj, datetime):
@@ -17,26 +17,9 @@ for path in paths:
     with path.open('r', encoding='utf-8') as f:
         data = json.load(f)
 
-    for conv in data:
-        # messages = []
-        # for msg in conv['messages']:
-        #     new_message = {
-        #         'role': msg.get('role'),
-        #         'content': msg.get('content'),
-        #         'en': msg.get('en'),
-        #         'timestamp': msg.get('timestamp')
-        #     }
-        #     messages.append(new_message)
-        
-        # corr_doc = find_doc(messages)
-        corr_doc = find_doc_by_id(conv['_id'] if '_id' in conv else None)
-        if corr_doc:
-            conv['_id'] = corr_doc.get('_id')
-            conv['language'] = corr_doc.get('language')
-            conv['expiry'] = corr_doc.get('expiry')
-            global_count_1 += 1
-        else:
-            global_count += 1
+    found = enrich_by_id(data, fields=("language", "expiry"))
+    global_count_1 += found
+    global_count += len(data) - found
 
     # Create new path for output file
     # output_path = str(path.resolve()).replace('messages.modified.json', 'messages.modified_2.json')
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "translation_cache.sqlite3"
+
+MISS = object()
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class TranslationCache:
+    """
+    On-disk, content-addressed cache for Azure detect / transliterate / translate results.
+
+    Entries are keyed by sha256(namespace, target, text), so the same text sent from
+    any script (daily pipeline, backfills of old folders) is only paid for once.
+
+    Args:
+        path: SQLite file location.
+        ttl_seconds: Entries older than this are treated as misses and evicted. None keeps entries forever.
+        max_entries: When set, least recently used entries beyond this count are evicted.
+        cache_only: Offline mode. Callers should not hit the API on a miss.
+    """
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_CACHE_PATH,
+        ttl_seconds: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        cache_only: bool = False,
+    ):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.cache_only = cache_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(namespace: str, target: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\x1f{target}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get_many(self, namespace: str, target: str, texts: Sequence[str]) -> List[Any]:
+        """Return cached values aligned with texts; misses are the MISS sentinel."""
+        keys = [self.make_key(namespace, target, text) for text in texts]
+        found: Dict[str, Any] = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if not self._is_expired(created_at, now):
+                        found[key] = json.loads(value)
+            if found:
+                self._conn.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            results = [found.get(key, MISS) for key in keys]
+            hit_count = sum(1 for value in results if value is not MISS)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def get(self, namespace: str, target: str, text: str) -> Any:
+        return self.get_many(namespace, target, [text])[0]
+
+    def set_many(self, namespace: str, target: str, items: Sequence[Tuple[str, Any]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (self.make_key(namespace, target, text), namespace, json.dumps(value, ensure_ascii=False), now, now)
+            for text, value in items
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+        if self.max_entries is not None:
+            self.evict()
+
+    def set(self, namespace: str, target: str, text: str, value: Any) -> None:
+        self.set_many(namespace, target, [(text, value)])
+
+    def evict(self) -> int:
+        """Remove expired entries, then least recently used ones beyond max_entries."""
+        removed = 0
+        with self._lock:
+            if self.ttl_seconds is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                )
+                removed += cursor.rowcount
+            if self.max_entries is not None:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+                excess = count - self.max_entries
+                if excess > 0:
+                    cursor = self._conn.execute(
+                        "DELETE FROM cache WHERE key IN "
+                        "(SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                        (excess,),
+                    )
+                    removed += cursor.rowcount
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cache_only": self.cache_only,
+        }
+
+    def print_stats(self) -> None:
+        s = self.stats()
+        print(f"Translation cache: {s['hits']} hits, {s['misses']} misses "
+              f"(hit rate {s['hit_rate']:.1%}), {s['entries']} entries")
+
+
+_cache: Optional[TranslationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TranslationCache:
+    """
+    Shared cache instance configured from the environment:
+    TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_TTL_SECONDS, TRANSLATION_CACHE_MAX_ENTRIES,
+    TRANSLATION_CACHE_ONLY (set to 1 for offline cache-only mode).
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranslationCache(
+                path=Path(os.getenv("TRANSLATION_CACHE_PATH", str(DEFAULT_CACHE_PATH))),
+                ttl_seconds=_env_int("TRANSLATION_CACHE_TTL_SECONDS"),
+                max_entries=_env_int("TRANSLATION_CACHE_MAX_ENTRIES"),
+                cache_only=os.getenv("TRANSLATION_CACHE_ONLY", "0") == "1",
+            )
+        return _cache